@@ -6,4 +6,8 @@ fi
 
 if [ "$1" = "server" ]; then
     exec python server.py
-fi
\ No newline at end of file
+fi
+
+if [ "$1" = "migrate" ]; then
+    exec python migrate.py "${@:2}"
+fi
@@ -0,0 +1,87 @@
+import asyncio
+from nats.aio.client import Client
+from database.models import PushSubscription, Site
+from log.logger import server_logger
+from pubsub.connection import CONFIG_DOMAIN_BLACKLIST, SUBJECT_CONFIG_INVALIDATE
+from util.keyword import KeywordSetMatcher, parse_keywords
+
+
+# 站点和推送订阅配置的进程内缓存, 启动时加载, 配置修改后通过消息通知所有服务实例重新加载
+# 直接修改数据库的配置没有失效通知, 由定期重新加载或管理接口/site/config/reload生效
+class SiteConfigCache:
+    _sites: dict[int, Site] = {}
+    _subscriptions: dict[int, list[PushSubscription]] = {}
+    _matchers: dict[int, KeywordSetMatcher] = {}
+    _conn: Client | None = None
+
+    @classmethod
+    async def load(cls):
+        sites = await Site.all().only("id", "name", "content_filter_keywords")
+        subscriptions: dict[int, list[PushSubscription]] = {}
+        for subscription in await PushSubscription.all():
+            subscriptions.setdefault(subscription.site_id, []).append(subscription)
+
+        # 加载完成后整体替换, 读取方不会看到加载到一半的数据
+        cls._sites = {site.id: site for site in sites}
+        cls._subscriptions = subscriptions
+        cls._matchers = {}
+
+    # 订阅配置失效通知, 不使用队列组, 每个服务实例都会收到
+    @classmethod
+    async def listen(cls, sub_conn: Client):
+        cls._conn = sub_conn
+        sub = await sub_conn.subscribe(SUBJECT_CONFIG_INVALIDATE)
+        async for msg in sub.messages:
+            if msg.data == CONFIG_DOMAIN_BLACKLIST:
+                continue
+            try:
+                await cls.load()
+                server_logger.info(f"Site config cache reloaded, sites: {len(cls._sites)}")
+            except Exception as e:
+                server_logger.error(f"Reload site config cache error: {e}")
+
+    # 定期重新加载
+    @classmethod
+    async def run_reload(cls, interval: int = 300):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await cls.load()
+            except Exception as e:
+                server_logger.error(f"Reload site config cache error: {e}")
+
+    # 配置修改后调用, 重新加载本实例缓存并通知其他实例
+    @classmethod
+    async def invalidate(cls):
+        await cls.load()
+        if cls._conn is not None and not cls._conn.is_closed:
+            await cls._conn.publish(SUBJECT_CONFIG_INVALIDATE, b"")
+
+    @classmethod
+    async def get_site(cls, site_id: int) -> Site:
+        site = cls._sites.get(site_id)
+        if site is None:
+            # 其他实例新增的站点可能尚未收到失效通知, 从数据库读取
+            site = await Site.get(id=site_id).only("id", "name", "content_filter_keywords")
+            cls._sites[site_id] = site
+        return site
+
+    @classmethod
+    def get_subscriptions(cls, site_id: int) -> list[PushSubscription]:
+        return cls._subscriptions.get(site_id, [])
+
+    # 站点过滤关键词和该站点所有订阅的关键词合并为一个匹配器, 只扫描一次文本
+    # 返回是否命中站点过滤关键词, 以及命中推送过滤关键词的订阅
+    @classmethod
+    async def match(cls, site_id: int, title: str, content: str) -> tuple[bool, list[PushSubscription]]:
+        site = await cls.get_site(site_id)
+        subscriptions = cls.get_subscriptions(site_id)
+        matcher = cls._matchers.get(site_id)
+        if matcher is None:
+            matcher = KeywordSetMatcher(
+                [parse_keywords(site.content_filter_keywords)] + [parse_keywords(subscription.filter_keywords) for subscription in subscriptions]
+            )
+            cls._matchers[site_id] = matcher
+
+        hits = matcher.match(title, content)
+        return hits[0], [subscription for subscription, hit in zip(subscriptions, hits[1:]) if hit]
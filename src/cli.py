@@ -1,9 +1,9 @@
-import hashlib
 from tortoise import run_async
 
 from database.connection import init_db
 from database.models import PageSignature, Site
 from settings import Settings
+from util.page import get_signature
 
 
 
@@ -27,7 +27,7 @@ async def main():
         "https://www.qq.com",
     ]
     for i, url in enumerate(test_urls):
-        sig = PageSignature(page_id=i+1, signature=hashlib.md5(url.encode()).hexdigest())
+        sig = PageSignature(page_id=i+1, signature=get_signature(url))
         await sig.save()
 
 run_async(main())
\ No newline at end of file
@@ -1,18 +1,23 @@
 
 
-import hashlib
-from pydantic import BaseModel
+from pydantic import BaseModel, field_serializer
 from log.logger import crawl_logger
 from util.http import HttpClient
+from util.page import get_signature
 
 
 class ApiNews(BaseModel):
     title: str
     url: str
     website: str
-    signature: str
+    signature: int
     date: str
 
+    # 64位签名超出JS安全整数范围, 响应中以字符串返回
+    @field_serializer("signature")
+    def serialize_signature(self, signature: int) -> str:
+        return str(signature)
+
 async def search_web_news(keywords: str) -> list[ApiNews]:
     url = "https://qianfan.baidubce.com/v2/ai_search/web_search"
 
@@ -44,7 +49,7 @@ async def search_web_news(keywords: str) -> list[ApiNews]:
             title=ref["title"].strip(),
             url=ref["url"].strip(),
             website=ref["website"].strip(),
-            signature=hashlib.md5(ref["url"].encode()).hexdigest(),
+            signature=get_signature(ref["url"]),
             date=ref["date"].strip()
         ) for ref in data["references"]]
 
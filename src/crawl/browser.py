@@ -1,10 +1,15 @@
-from datetime import datetime
+import asyncio
+from contextlib import asynccontextmanager
 import json
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CacheMode, JsonCssExtractionStrategy, CrawlerRunConfig, LXMLWebScrapingStrategy
+from typing import AsyncIterator
+from weakref import WeakSet
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CacheMode, CrawlResult, CrawlerRunConfig, LXMLWebScrapingStrategy
 from playwright.async_api import BrowserContext, Page, Route
-from crawl.util import DetailResult, browser_blacklist_url_keys, filter_links, generate_extraction_schema
+from crawl.extract import ExtractPool
+from crawl.host import HostScheduler
+from crawl.rule import get_extraction_strategy
+from crawl.util import DetailResult, ListResult, browser_blacklist_url_keys, filter_links
 from log.logger import crawl_logger
-from trafilatura import extract, extract_metadata
 
 browser_config = BrowserConfig(
     headless=True,
@@ -23,44 +28,136 @@ run_config = CrawlerRunConfig(
     # magic=True,
 )
 
-# 爬取列表页
-async def crawl_list_using_browser(url: str, rule: list[str]) -> dict[str, str]:
-    async with AsyncWebCrawler(config=browser_config) as crawler:
+# 浏览器崩溃时的错误信息, 命中后回收该浏览器
+BROWSER_CRASH_KEYS = [
+    "Target page, context or browser has been closed",
+    "Browser has been closed",
+    "Target closed",
+    "Browser closed",
+]
+
+
+# 单个常驻浏览器, 记录已抓取页面数量用于定期回收
+class BrowserSlot:
+    def __init__(self, index: int):
+        self.index = index
+        self.crawler: AsyncWebCrawler | None = None
+        self.pages = 0
+
+    async def start(self):
+        self.crawler = AsyncWebCrawler(config=browser_config)
+        await self.crawler.start()
         # 设置过滤无用资源请求
-        crawler.crawler_strategy.set_hook("on_page_context_created", on_page_context_created)
-
-        # 设置提取规则
-        schema = generate_extraction_schema(rule)
-        run_config.extraction_strategy = JsonCssExtractionStrategy(schema=schema)
-
-        result = await crawler.arun(url, config=run_config)
-        if result.success:
-            try:
-                page_urls = json.loads(result.extracted_content)
-                return filter_links(url, page_urls)
-            except Exception as e:
-                crawl_logger.error(f"CrawlList extract failed: {url} {e}")
-        else:
-            crawl_logger.error(f"CrawlList failed: {url} {result.error_message}")
-        return {}
+        self.crawler.crawler_strategy.set_hook("on_page_context_created", on_page_context_created)
+        self.pages = 0
+
+    async def close(self):
+        if self.crawler is None:
+            return
+        try:
+            await self.crawler.close()
+        except Exception as e:
+            crawl_logger.error(f"Browser slot {self.index} close failed: {e}")
+        finally:
+            self.crawler = None
+
+
+# 进程内共享的浏览器池, worker启动时预热固定数量的浏览器, 每次抓取借出一个
+class BrowserPool:
+    _slots: list[BrowserSlot] = []
+    _idle: asyncio.Queue[BrowserSlot] | None = None
+    _max_pages: int = 100
+
+    @classmethod
+    async def init(cls, size: int = 2, max_pages: int = 100):
+        cls._max_pages = max_pages
+        cls._slots = [BrowserSlot(i) for i in range(size)]
+        cls._idle = asyncio.Queue()
+        for slot in cls._slots:
+            await slot.start()
+            cls._idle.put_nowait(slot)
+
+    @classmethod
+    async def shutdown(cls):
+        for slot in cls._slots:
+            await slot.close()
+        cls._slots = []
+        cls._idle = None
+
+    # 借出一个浏览器, 达到最大页面数或崩溃后自动回收重启
+    @classmethod
+    @asynccontextmanager
+    async def acquire(cls) -> AsyncIterator[BrowserSlot]:
+        if cls._idle is None:
+            raise RuntimeError("Browser pool not initialized")
+
+        slot = await cls._idle.get()
+        try:
+            if slot.crawler is None or slot.pages >= cls._max_pages:
+                crawl_logger.info(f"Recycle browser slot {slot.index}, pages: {slot.pages}")
+                await slot.close()
+                await slot.start()
+            yield slot
+        except Exception:
+            # 抓取过程中抛出异常, 浏览器状态未知, 下次借出时重启
+            await slot.close()
+            raise
+        finally:
+            cls._idle.put_nowait(slot)
+
+    # 使用池中的浏览器抓取页面, 先获取浏览器再获取域名名额, 等待浏览器时不占用域名的并发名额
+    @classmethod
+    async def crawl(cls, url: str, config: CrawlerRunConfig) -> CrawlResult:
+        async with cls.acquire() as slot:
+            async with HostScheduler.slot(url) as ticket:
+                result = await slot.crawler.arun(url, config=config)
+                # 没有响应码的失败(超时等)同样计入域名错误
+                ticket.status = result.status_code
+                ticket.failed = not result.success and result.status_code is None
+
+            slot.pages += 1
+            if not result.success and any(key in (result.error_message or "") for key in BROWSER_CRASH_KEYS):
+                crawl_logger.error(f"Browser slot {slot.index} crashed: {result.error_message}")
+                await slot.close()
+            return result
+
+
+# 爬取列表页
+async def crawl_list_using_browser(url: str, rule: list[str]) -> ListResult:
+    # 每次抓取使用独立的配置设置提取规则, 避免并发抓取互相覆盖
+    config = run_config.clone(extraction_strategy=get_extraction_strategy(rule))
+
+    result = await BrowserPool.crawl(url, config)
+    if result.success:
+        try:
+            page_urls = json.loads(result.extracted_content)
+            return ListResult(pages=filter_links(url, page_urls))
+        except Exception as e:
+            crawl_logger.error(f"CrawlList extract failed: {url} {e}")
+    else:
+        crawl_logger.error(f"CrawlList failed: {url} {result.error_message}")
+    return ListResult()
 
 
 # 爬取详情页
 async def crawl_detail_using_browser(url: str) -> DetailResult | None:
-    async with AsyncWebCrawler(config=browser_config) as crawler:
-        crawler.crawler_strategy.set_hook("on_page_context_created", on_page_context_created)
-        result = await crawler.arun(url, config=run_config)
-        if result.success:
-            content = extract(result.html)
-            metadata = extract_metadata(result.html)
-            return DetailResult(content=str(content), date=metadata.date or datetime.now().strftime("%Y-%m-%d"))
-        else:
-            crawl_logger.error(f"CrawlDetail failed: {url} {result.error_message}")
-            return None
+    result = await BrowserPool.crawl(url, run_config)
+    if result.success:
+        return await ExtractPool.extract_detail(result.html)
+    else:
+        crawl_logger.error(f"CrawlDetail failed: {url} {result.error_message}")
+        return None
 
 
+# 已设置资源过滤的浏览器上下文, 同一上下文只设置一次路由
+_routed_contexts: WeakSet[BrowserContext] = WeakSet()
+
 # 过滤无用资源请求
 async def on_page_context_created(page: Page, context: BrowserContext, **kwargs):
+    if context in _routed_contexts:
+        return
+    _routed_contexts.add(context)
+
     async def route_filter(route: Route):
         if route.request.resource_type in ["image", "stylesheet", "font", "media"] \
             or any(url_key in route.request.url for url_key in browser_blacklist_url_keys): # 过滤无用资源请求
@@ -70,4 +167,4 @@ async def on_page_context_created(page: Page, context: BrowserContext, **kwargs)
             crawl_logger.debug(f"Allowing request: {route.request.url}")
             await route.continue_()
 
-    await context.route("**", route_filter)
\ No newline at end of file
+    await context.route("**", route_filter)
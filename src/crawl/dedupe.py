@@ -0,0 +1,81 @@
+import asyncio
+from collections import OrderedDict
+from crawl.util import duplicate_url
+from log.logger import crawl_logger
+from util.bloom import BloomFilter
+from util.http import HttpClient
+from util.page import get_signature
+
+
+# worker本地url去重, 布隆过滤器和最近已爬取url缓存命中的url不再请求去重API
+class UrlDeduplicator:
+    _deduplicate_api: str = ""
+    _bloom_api: str = ""
+    _refresh_interval: int = 600
+    _seen_size: int = 100000
+    _bloom: BloomFilter | None = None
+    _seen: OrderedDict[int, None] = OrderedDict()
+    _refresh_task: asyncio.Task | None = None
+
+    @classmethod
+    def init(cls, deduplicate_api: str, bloom_api: str = "", refresh_interval: int = 600, seen_size: int = 100000):
+        cls._deduplicate_api = deduplicate_api
+        cls._bloom_api = bloom_api
+        cls._refresh_interval = refresh_interval
+        cls._seen_size = seen_size
+        cls._bloom = None
+        cls._seen = OrderedDict()
+        if bloom_api:
+            cls._refresh_task = asyncio.create_task(cls._refresh_loop())
+
+    @classmethod
+    def shutdown(cls):
+        if cls._refresh_task is not None:
+            cls._refresh_task.cancel()
+            cls._refresh_task = None
+
+    # 定期下载服务端构建的签名布隆过滤器
+    @classmethod
+    async def _refresh_loop(cls):
+        while True:
+            try:
+                data = await HttpClient.get_bytes(cls._bloom_api)
+                cls._bloom = BloomFilter.from_bytes(data)
+                crawl_logger.info(f"Signature bloom refreshed, size: {len(data)} bytes")
+            except Exception as e:
+                crawl_logger.error(f"Signature bloom refresh error: {e}")
+            await asyncio.sleep(cls._refresh_interval)
+
+    @classmethod
+    def _remember(cls, key: int):
+        cls._seen[key] = None
+        cls._seen.move_to_end(key)
+        if len(cls._seen) > cls._seen_size:
+            cls._seen.popitem(last=False)
+
+    # 返回未爬取过的url, 请求去重API失败时返回None
+    @classmethod
+    async def duplicate(cls, urls: dict[str, str]) -> dict[str, str] | None:
+        maybe_new_urls = {}
+        keys = {}
+        for url, title in urls.items():
+            key = get_signature(url)
+            if key in cls._seen:
+                cls._seen.move_to_end(key)
+                continue
+            if cls._bloom is not None and key in cls._bloom:
+                continue
+            maybe_new_urls[url] = title
+            keys[url] = key
+
+        if len(maybe_new_urls) == 0:
+            return {}
+
+        new_urls = await duplicate_url(cls._deduplicate_api, maybe_new_urls)
+        if new_urls is None:
+            return None
+
+        # 去重API确认已爬取的url记入本地缓存
+        for url in maybe_new_urls.keys() - new_urls.keys():
+            cls._remember(keys[url])
+        return new_urls
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import multiprocessing
+import os
+from typing import Any, Callable, TypeVar
+from trafilatura import bare_extraction
+from crawl.rule import get_extraction_strategy
+from crawl.util import DetailResult
+from log.logger import crawl_logger
+
+T = TypeVar("T")
+
+
+# 正文和列表页提取进程池, 避免trafilatura和列表页解析的CPU计算阻塞事件循环
+# 子进程异常退出(如内存不足被杀)后进程池不可用, 重建进程池并重试一次, 再次失败只影响当前页面
+class ExtractPool:
+    _executor: ProcessPoolExecutor | None = None
+    _workers: int = 0
+
+    @classmethod
+    def init(cls, workers: int = 0):
+        cls._workers = workers
+        cls._executor = cls._create_executor()
+
+    @classmethod
+    def _create_executor(cls) -> ProcessPoolExecutor:
+        # 使用spawn启动子进程, 避免在已启动浏览器和线程的进程中fork
+        return ProcessPoolExecutor(
+            max_workers=cls._workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    # 替换已损坏的进程池, 同时失败的多个任务只重建一次
+    @classmethod
+    def _rebuild(cls, broken: ProcessPoolExecutor):
+        if cls._executor is not broken:
+            return
+        crawl_logger.error("Extract process pool broken, rebuilding")
+        broken.shutdown(wait=False, cancel_futures=True)
+        cls._executor = cls._create_executor()
+
+    @classmethod
+    async def _submit(cls, fn: Callable[..., T], *args) -> T:
+        for attempt in range(2):
+            executor = cls._executor
+            if executor is None:
+                raise RuntimeError("Extract pool not initialized")
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                cls._rebuild(executor)
+                if attempt == 1:
+                    raise
+
+    @classmethod
+    async def extract_detail(cls, html: str) -> DetailResult:
+        return await cls._submit(extract_detail, html)
+
+    @classmethod
+    async def extract_list(cls, url: str, rule: list[str], html: str) -> list[dict[str, Any]]:
+        return await cls._submit(extract_list, url, rule, html)
+
+
+# 按列表页解析规则提取链接, 相同规则的提取策略在每个子进程中缓存
+def extract_list(url: str, rule: list[str], html: str) -> list[dict[str, Any]]:
+    return get_extraction_strategy(rule).run(url, [html])
+
+
+# 提取正文和日期, html只解析一次, 正文和元数据在同一次提取中得到
+def extract_detail(html: str) -> DetailResult:
+    today = datetime.now().strftime("%Y-%m-%d")
+    document = bare_extraction(html, with_metadata=True)
+    if document is None:
+        return DetailResult(content="", date=today)
+
+    # 与trafilatura.extract的纯文本输出保持一致, 评论内容附加在正文之后
+    content = document.text or ""
+    if document.comments:
+        content = f"{content}\n{document.comments}".strip()
+    return DetailResult(content=content, date=document.date or today)
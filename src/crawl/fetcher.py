@@ -0,0 +1,74 @@
+from dataclasses import dataclass, field
+import re
+import aiohttp
+from crawl.host import HostScheduler
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36"
+
+# 从html头部的meta标签中识别编码
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-]+)""", re.IGNORECASE)
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int
+    text: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+# 静态页面抓取器, worker内共享一个会话, 复用长连接、DNS缓存和TLS连接
+class StaticFetcher:
+    _session: aiohttp.ClientSession | None = None
+
+    @classmethod
+    async def init(cls, conn_limit: int = 100, conn_limit_per_host: int = 10, timeout: int = 20, dns_cache_ttl: int = 300, keepalive_timeout: int = 60):
+        connector = aiohttp.TCPConnector(
+            limit=conn_limit,
+            limit_per_host=conn_limit_per_host,
+            ttl_dns_cache=dns_cache_ttl,
+            keepalive_timeout=keepalive_timeout,
+            ssl=False,
+        )
+        cls._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={"User-Agent": USER_AGENT},
+        )
+
+    @classmethod
+    async def shutdown(cls):
+        if cls._session is not None:
+            await cls._session.close()
+            cls._session = None
+
+    @classmethod
+    async def fetch(cls, url: str, headers: dict[str, str] | None = None) -> FetchResult:
+        if cls._session is None:
+            raise ConnectionError("Static fetcher not initialized")
+
+        async with HostScheduler.slot(url) as ticket:
+            async with cls._session.get(url, headers=headers, allow_redirects=True) as response:
+                ticket.status = response.status
+                body = await response.read()
+                return FetchResult(
+                    url=str(response.url),
+                    status=response.status,
+                    text=decode_html(body, response.charset),
+                    headers={key.lower(): value for key, value in response.headers.items()},
+                )
+
+
+# 解码页面内容, 优先使用响应头编码, 其次使用meta标签编码, 最后使用utf-8
+def decode_html(body: bytes, charset: str | None) -> str:
+    if not charset:
+        match = META_CHARSET_PATTERN.search(body[:4096])
+        charset = match.group(1).decode("ascii") if match else "utf-8"
+
+    # gb2312/gbk是gb18030的子集, 统一使用gb18030避免生僻字解码失败
+    if charset.lower() in ("gb2312", "gbk"):
+        charset = "gb18030"
+
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
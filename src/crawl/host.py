@@ -0,0 +1,125 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+import time
+from typing import AsyncIterator
+from urllib.parse import urlparse
+
+from log.logger import crawl_logger
+from util.ratelimit import TokenBucket
+
+# 乘性减小系数
+DECREASE_FACTOR = 0.5
+# 空闲超过该秒数的域名状态被清理, 外链域名较多时避免状态无限增长
+HOST_IDLE_TTL = 600
+
+
+# 单次请求的结果, 由调用方填写, 用于调整域名的并发和速率
+@dataclass
+class HostTicket:
+    status: int | None = None
+    failed: bool = False
+
+
+# 单个域名的抓取状态, 令牌桶控制请求速率, AIMD控制并发数
+class HostState:
+    def __init__(self, host: str, rate: float, burst: float, max_concurrency: int, latency_threshold: float):
+        self.host = host
+        self.base_rate = rate
+        self.max_concurrency = max_concurrency
+        self.latency_threshold = latency_threshold
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = 1.0
+        self.inflight = 0
+        self.last_used = time.monotonic()
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+            self.last_used = time.monotonic()
+        try:
+            await self.bucket.acquire()
+        except asyncio.CancelledError:
+            async with self.cond:
+                self.inflight -= 1
+                self.cond.notify_all()
+            raise
+
+    async def release(self, healthy: bool, failed: bool):
+        async with self.cond:
+            self.inflight -= 1
+            self.last_used = time.monotonic()
+            if failed:
+                # 超时、429、5xx时并发和速率都乘性减小
+                self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+                self.bucket.rate = max(self.base_rate * DECREASE_FACTOR ** 4, self.bucket.rate * DECREASE_FACTOR)
+                crawl_logger.info(f"Host backoff: {self.host}, concurrency: {int(self.limit)}, rate: {self.bucket.rate:.3f}/s")
+            elif healthy:
+                # 延迟正常时并发加性增大, 每满一轮并发加1, 速率逐步恢复到初始值
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                self.bucket.rate = min(self.base_rate, self.bucket.rate + self.base_rate / 10)
+            self.cond.notify_all()
+
+
+# 按域名调度抓取请求, 大站点逐步提高并发, 脆弱站点出错后自动退避
+# 空闲的域名状态定期清理, 清理后再次抓取时以初始并发和速率重新开始
+class HostScheduler:
+    _hosts: dict[str, HostState] = {}
+    _last_sweep: float = 0
+    _rate: float = 0.5
+    _burst: float = 2
+    _max_concurrency: int = 4
+    _latency_threshold: float = 5
+
+    @classmethod
+    def init(cls, rate: float = 0.5, burst: float = 2, max_concurrency: int = 4, latency_threshold: float = 5):
+        cls._hosts = {}
+        cls._last_sweep = time.monotonic()
+        cls._rate = rate
+        cls._burst = burst
+        cls._max_concurrency = max_concurrency
+        cls._latency_threshold = latency_threshold
+
+    @classmethod
+    def _get(cls, url: str) -> HostState:
+        cls._sweep()
+        host = urlparse(url).netloc
+        state = cls._hosts.get(host)
+        if state is None:
+            state = HostState(host, cls._rate, cls._burst, cls._max_concurrency, cls._latency_threshold)
+            cls._hosts[host] = state
+        return state
+
+    # 清理没有进行中请求且空闲超过HOST_IDLE_TTL的域名
+    @classmethod
+    def _sweep(cls):
+        now = time.monotonic()
+        if now - cls._last_sweep < HOST_IDLE_TTL / 10:
+            return
+        cls._last_sweep = now
+        idle_hosts = [host for host, state in cls._hosts.items() if state.inflight == 0 and now - state.last_used > HOST_IDLE_TTL]
+        for host in idle_hosts:
+            del cls._hosts[host]
+        if idle_hosts:
+            crawl_logger.info(f"Host states evicted: {len(idle_hosts)}, remaining: {len(cls._hosts)}")
+
+    # 获取域名的抓取名额, 退出时根据请求结果调整该域名的并发和速率
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, url: str) -> AsyncIterator[HostTicket]:
+        state = cls._get(url)
+        await state.acquire()
+
+        ticket = HostTicket()
+        start_time = time.monotonic()
+        try:
+            yield ticket
+        except Exception:
+            ticket.failed = True
+            raise
+        finally:
+            latency = time.monotonic() - start_time
+            failed = ticket.failed or (ticket.status is not None and (ticket.status == 429 or ticket.status >= 500))
+            await state.release(healthy=latency <= state.latency_threshold, failed=failed)
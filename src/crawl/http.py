@@ -1,63 +1,47 @@
-from datetime import datetime
-import json
-from crawl4ai import (
-    AsyncWebCrawler,
-    CacheMode,
-    HTTPCrawlerConfig,
-    JsonCssExtractionStrategy,
-    CrawlerRunConfig,
-    LXMLWebScrapingStrategy,
-)
-from crawl4ai.async_crawler_strategy import AsyncHTTPCrawlerStrategy
-from crawl.util import DetailResult, filter_links, generate_extraction_schema
+from crawl.extract import ExtractPool
+from crawl.fetcher import StaticFetcher
+from crawl.util import DetailResult, ListResult, conditional_headers, filter_links
 from log.logger import crawl_logger
-from trafilatura import extract, extract_metadata
 
-http_crawler_config = HTTPCrawlerConfig(
-    method="GET",
-    headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36"},
-    follow_redirects=True,
-    verify_ssl=False,
-)
 
-PAGE_TIMEOUT = 20000
+# 爬取列表页, 携带上次的ETag/Last-Modified发起条件请求
+async def crawl_list_using_http(url: str, rule: list[str], etag: str = "", last_modified: str = "") -> ListResult:
+    try:
+        result = await StaticFetcher.fetch(url, headers=conditional_headers(etag, last_modified))
+    except Exception as e:
+        crawl_logger.error(f"CrawlList failed: {url} {e}")
+        return ListResult()
 
-run_config = CrawlerRunConfig(
-    scraping_strategy=LXMLWebScrapingStrategy(),
-    cache_mode=CacheMode.DISABLED,
-    page_timeout=PAGE_TIMEOUT,
-    magic=True,
-)
+    if result.status == 304:
+        return ListResult(etag=etag, last_modified=last_modified, not_modified=True)
 
+    if result.status >= 400:
+        crawl_logger.error(f"CrawlList failed: {url} status: {result.status}")
+        return ListResult()
 
-# 爬取列表页
-async def crawl_list_using_http(url: str, rule: list[str]) -> dict[str, str]:
-    async with AsyncWebCrawler(crawler_strategy=AsyncHTTPCrawlerStrategy(browser_config=http_crawler_config)) as crawler:
-
-        # 设置提取规则
-        schema = generate_extraction_schema(rule)
-        run_config.extraction_strategy = JsonCssExtractionStrategy(schema=schema)
-
-        result = await crawler.arun(url, config=run_config)
-        if result.success:
-            try:
-                page_urls = json.loads(result.extracted_content)
-                return filter_links(url, page_urls)
-            except Exception as e:
-                crawl_logger.error(f"CrawlList extract failed: {url} {e}")
-        else:
-            crawl_logger.error(f"CrawlList failed: {url} {result.error_message}")
-        return {}
+    try:
+        # 直接在抓取到的html上执行提取, 在进程池中运行避免阻塞事件循环
+        page_urls = await ExtractPool.extract_list(url, rule, result.text)
+        return ListResult(
+            pages=filter_links(url, page_urls),
+            etag=result.headers.get("etag", ""),
+            last_modified=result.headers.get("last-modified", ""),
+        )
+    except Exception as e:
+        crawl_logger.error(f"CrawlList extract failed: {url} {e}")
+        return ListResult()
 
 
 # 爬取详情页
 async def crawl_detail_using_http(url: str) -> DetailResult | None:
-    async with AsyncWebCrawler(crawler_strategy=AsyncHTTPCrawlerStrategy(browser_config=http_crawler_config)) as crawler:
-        result = await crawler.arun(url, config=run_config)
-        if result.success:
-            content = extract(result.html)
-            metadata = extract_metadata(result.html)
-            return DetailResult(content=content, date=metadata.date or datetime.now().strftime("%Y-%m-%d"))
-        else:
-            crawl_logger.error(f"CrawlDetail failed: {url} {result.error_message}")
-            return None
\ No newline at end of file
+    try:
+        result = await StaticFetcher.fetch(url)
+    except Exception as e:
+        crawl_logger.error(f"CrawlDetail failed: {url} {e}")
+        return None
+
+    if result.status >= 400:
+        crawl_logger.error(f"CrawlDetail failed: {url} status: {result.status}")
+        return None
+
+    return await ExtractPool.extract_detail(result.text)
@@ -1,18 +1,22 @@
+from functools import lru_cache
+import json
 from log.logger import crawl_logger
 from jsonpath_ng import parse
+from jsonpath_ng.jsonpath import JSONPath
 from dataclasses import dataclass
 
-from util.http import HttpClient
+from crawl.fetcher import StaticFetcher
+from crawl.util import ListResult, conditional_headers
 
 headers = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36",
 }
 
-# 爬取列表页
-async def crawl_list_using_json(url: str, rule: list[str]) -> tuple[dict[str, str], dict[str, str]]:
+# 爬取列表页, 携带上次的ETag/Last-Modified发起条件请求
+async def crawl_list_using_json(url: str, rule: list[str], etag: str = "", last_modified: str = "") -> ListResult:
     if len(rule) < 4:
         crawl_logger.error(f"CrawlList using json failed: {url} rule length is less than 4")
-        return {}, {}
+        return ListResult()
 
     extract_rule = JsonExtractRule(
         base_path=rule[0],
@@ -22,15 +26,27 @@ async def crawl_list_using_json(url: str, rule: list[str]) -> tuple[dict[str, st
         display_url=rule[4] if len(rule) == 5 else ""
     )
     try:
-        data = await HttpClient.get(url, headers=headers)
-        return extract_json_data(data, extract_rule)
+        result = await StaticFetcher.fetch(url, headers={**headers, **conditional_headers(etag, last_modified)})
+        if result.status == 304:
+            return ListResult(etag=etag, last_modified=last_modified, not_modified=True)
+        if result.status >= 400:
+            crawl_logger.error(f"CrawlList using json failed: {url} status: {result.status}")
+            return ListResult()
+
+        pages, display_urls = extract_json_data(json.loads(result.text), extract_rule)
+        return ListResult(
+            pages=pages,
+            display_urls=display_urls,
+            etag=result.headers.get("etag", ""),
+            last_modified=result.headers.get("last-modified", ""),
+        )
 
     except Exception as e:
         crawl_logger.error(f"CrawlList using json failed: {url} {e}")
-        return {}, {}
+        return ListResult()
 
 
-@dataclass
+@dataclass(frozen=True)
 class JsonExtractRule:
     base_path: str
     title_path: str
@@ -39,29 +55,46 @@ class JsonExtractRule:
     display_url: str
 
 
+@dataclass(frozen=True)
+class CompiledJsonRule:
+    base_expr: JSONPath
+    title_expr: JSONPath
+    url_expr: JSONPath
+    display_url_expr: JSONPath | None
+    compose_template: str
+
+
+# 解析jsonpath表达式, 相同的规则只解析一次
+@lru_cache(maxsize=1024)
+def compile_json_rule(rule: JsonExtractRule) -> CompiledJsonRule:
+    return CompiledJsonRule(
+        base_expr=parse(rule.base_path),
+        title_expr=parse(rule.title_path),
+        url_expr=parse(rule.url_path),
+        display_url_expr=parse(rule.display_url) if rule.display_url else None,
+        compose_template=rule.compose_template,
+    )
+
+
 # 提取json数据，返回url到标题的映射
 def extract_json_data(root: dict, rule: JsonExtractRule) -> tuple[dict[str, str], dict[str, str]]:
-    # 解析jsonpath表达式
-    base_expr = parse(rule.base_path)
-    title_expr = parse(rule.title_path)
-    url_expr = parse(rule.url_path)
-    display_url_expr = parse(rule.display_url) if rule.display_url else None
+    compiled_rule = compile_json_rule(rule)
 
     results = {}
     display_url_results = {}
 
-    url_list = base_expr.find(root)  # 提取列表
+    url_list = compiled_rule.base_expr.find(root)  # 提取列表
     for item in url_list:
-        title = title_expr.find(item.value)[0].value  # 提取标题
-        url = url_expr.find(item.value)[0].value  # 提取url
+        title = compiled_rule.title_expr.find(item.value)[0].value  # 提取标题
+        url = compiled_rule.url_expr.find(item.value)[0].value  # 提取url
 
         # 根据预设模板拼接url
-        if rule.compose_template:
-            url = rule.compose_template.replace("$", url)
+        if compiled_rule.compose_template:
+            url = compiled_rule.compose_template.replace("$", url)
         results[url] = title
 
-        if display_url_expr: # 如果配置了显示url，则将显示url和url拼接起来
-            display_url = display_url_expr.find(item.value)[0].value
+        if compiled_rule.display_url_expr: # 如果配置了显示url，则将显示url和url拼接起来
+            display_url = compiled_rule.display_url_expr.find(item.value)[0].value
             display_url_results[url] = display_url
 
     return results, display_url_results
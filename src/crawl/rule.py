@@ -0,0 +1,15 @@
+from functools import lru_cache
+from crawl4ai import JsonCssExtractionStrategy
+from crawl.util import generate_extraction_schema
+
+# 缓存的提取规则数量, 大于站点数量即可
+RULE_CACHE_SIZE = 1024
+
+
+# 获取列表页提取策略, 相同的解析规则只生成一次
+def get_extraction_strategy(rule: list[str]) -> JsonCssExtractionStrategy:
+    return _compile_extraction_strategy(tuple(rule))
+
+@lru_cache(maxsize=RULE_CACHE_SIZE)
+def _compile_extraction_strategy(rule: tuple[str, ...]) -> JsonCssExtractionStrategy:
+    return JsonCssExtractionStrategy(schema=generate_extraction_schema(list(rule)))
@@ -1,10 +1,14 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import hashlib
+import json
 from typing import Any
 from urllib.parse import urljoin, urlparse
 
 from crawl.api import ApiNews
-from database.models import DomainBlacklist, WebSearchNews
+from database.models import WebSearchNews
+from dedupe.signature import DomainBlacklistIndex
 from util.http import HttpClient
+from util.url import canonicalize_url
 from log.logger import crawl_logger
 
 @dataclass
@@ -12,6 +16,14 @@ class DetailResult:
     content: str
     date: str
 
+@dataclass
+class ListResult:
+    pages: dict[str, str] = field(default_factory=dict)
+    display_urls: dict[str, str] = field(default_factory=dict)
+    etag: str = ""
+    last_modified: str = ""
+    not_modified: bool = False
+
 
 # 浏览器黑名单域名列表
 browser_blacklist_url_keys = [
@@ -94,14 +106,38 @@ def compose_url(entry_url: str, url: str) -> str:
         return f"https:{url}" if entry_url.startswith("https") else f"http:{url}"
     return urljoin(entry_url, url)
 
-# 当前url列表与已爬取的url进行去重
-async def duplicate_url(deduplicate_api: str, urls: dict[str, str]) -> dict[str, str]:
+# 按规范化url合并列表页链接, 返回规范化url到原始url的映射
+def canonicalize_links(urls: dict[str, str], strip_params: list[str]) -> dict[str, str]:
+    canonical_urls = {}
+    for url in urls:
+        canonical_urls.setdefault(canonicalize_url(url, strip_params), url)
+    return canonical_urls
+
+# 构造列表页条件请求头
+def conditional_headers(etag: str, last_modified: str) -> dict[str, str]:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+# 列表页链接集合的签名, 用于判断列表页是否有变化
+def get_links_hash(urls: dict[str, str]) -> str:
+    return hashlib.md5("\n".join(sorted(urls.keys())).encode()).hexdigest()
+
+# 列表页地址和解析配置的md5值, 配置修改后已保存的列表页缓存状态失效
+def get_rule_hash(url: str, crawl_list_type: str, rule: list[str], url_strip_params: list[str]) -> str:
+    return hashlib.md5(json.dumps([url, crawl_list_type, rule, url_strip_params], ensure_ascii=False).encode()).hexdigest()
+
+# 当前url列表与已爬取的url进行去重, 请求失败时返回None
+async def duplicate_url(deduplicate_api: str, urls: dict[str, str]) -> dict[str, str] | None:
     try:
         results = await HttpClient.post(deduplicate_api, list(urls.keys()))
         return {url: title for url, title in urls.items() if url in results.get("data", [])}
     except Exception as e:
         crawl_logger.error(f"Duplicate url error: {e}")
-        return {}
+        return None
 
 # 判断两个url是否是同一个域名
 def is_same_domain(url1: str, url2: str) -> bool:
@@ -113,11 +149,9 @@ def is_same_domain(url1: str, url2: str) -> bool:
 async def duplicate_search_web_news(news: list[ApiNews]) -> list[ApiNews]:
     filtered_news = []
 
-    domin_blacklist = await DomainBlacklist.all().values_list("domain", flat=True)
-
     titles = []
     for news_item in news:
-        if any(domain in news_item.url for domain in domin_blacklist):
+        if DomainBlacklistIndex.is_blocked(news_item.url):
             continue
         
         # 标题先滤重
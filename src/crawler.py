@@ -1,15 +1,21 @@
 import asyncio
 import time
+from typing import Awaitable, Callable
 
 from nats.aio.client import Client
+from nats.aio.msg import Msg
 from nats.aio.subscription import Subscription
-from crawl.util import duplicate_url, is_same_domain
+from crawl.util import canonicalize_links, get_links_hash, is_same_domain
 from database.models import CrawlType
-from pubsub.connection import QUEUE_CRAWL_DETAILPAGE, QUEUE_CRAWL_LISTPAGE, QUEUE_CRAWL_PAGECONTENT, MsgQueue
-from pubsub.msg import CrawlDetailPageMsg, CrawlListPageMsg, CrawlPageContentMsg
+from pubsub.connection import QUEUE_CRAWL_DETAILPAGE, QUEUE_CRAWL_LISTPAGE, QUEUE_CRAWL_LISTSTATE, QUEUE_CRAWL_PAGECONTENT, MsgQueue
+from pubsub.msg import CrawlDetailPageMsg, CrawlListPageMsg, CrawlListStateMsg, CrawlPageContentMsg
 from settings import Settings
-from crawl.browser import crawl_detail_using_browser, crawl_list_using_browser
+from crawl.browser import BrowserPool, crawl_detail_using_browser, crawl_list_using_browser
+from crawl.dedupe import UrlDeduplicator
+from crawl.extract import ExtractPool
+from crawl.fetcher import StaticFetcher
 from crawl.http import crawl_detail_using_http, crawl_list_using_http
+from crawl.host import HostScheduler
 from crawl.json import crawl_list_using_json
 from log.logger import crawl_logger
 from util.http import HttpClient
@@ -25,6 +31,38 @@ async def main():
         await HttpClient.init(conn_limit=10, conn_limit_per_host=10, timeout=10)
         crawl_logger.info("HttpClient initialized")
 
+        # 初始化url去重
+        UrlDeduplicator.init(
+            deduplicate_api=settings.url_deduplicate_api,
+            bloom_api=settings.url_signature_bloom_api,
+            refresh_interval=settings.url_signature_bloom_refresh_interval,
+            seen_size=settings.url_seen_cache_size,
+        )
+
+        # 初始化静态页面抓取器
+        await StaticFetcher.init(
+            conn_limit=settings.static_fetch_conn_limit,
+            conn_limit_per_host=settings.static_fetch_conn_limit_per_host,
+            timeout=settings.static_fetch_timeout,
+        )
+        crawl_logger.info("StaticFetcher initialized")
+
+        # 初始化域名抓取节奏控制
+        HostScheduler.init(
+            rate=settings.crawl_host_rate,
+            burst=settings.crawl_host_burst,
+            max_concurrency=settings.crawl_host_max_concurrency,
+            latency_threshold=settings.crawl_host_latency_threshold,
+        )
+
+        # 初始化正文提取进程池
+        ExtractPool.init(workers=settings.extract_workers)
+        crawl_logger.info("ExtractPool initialized")
+
+        # 初始化浏览器池
+        await BrowserPool.init(size=settings.browser_pool_size, max_pages=settings.browser_pool_max_pages)
+        crawl_logger.info("BrowserPool initialized")
+
         # 初始化消息队列
         pub_conn = await MsgQueue.connect(settings)
         sub_listpage_conn = await MsgQueue.connect(settings)
@@ -40,8 +78,8 @@ async def main():
 
         # 启动消费任务
         await asyncio.gather(
-            crawl_list_page_loop(list_sub, pub_conn),
-            crawl_detail_page_loop(detail_sub, pub_conn),
+            crawl_list_page_loop(list_sub, pub_conn, settings.crawl_list_concurrency),
+            crawl_detail_page_loop(detail_sub, pub_conn, settings.crawl_detail_concurrency),
         )
     except Exception as e:
         crawl_logger.error(f"Main loop error: {e}")
@@ -52,57 +90,107 @@ async def main():
             await sub_listpage_conn.close()
         if sub_detailpage_conn and not sub_detailpage_conn.is_closed:
             await sub_detailpage_conn.close()
+        await BrowserPool.shutdown()
+        UrlDeduplicator.shutdown()
+        await StaticFetcher.shutdown()
+        ExtractPool.shutdown()
 
 # 爬取列表页
-async def crawl_list_page_loop(list_sub: Subscription, pub_conn: Client):
-    async for msg in list_sub.messages:
-        try:
-            msg = CrawlListPageMsg.model_validate_json(msg.data.decode("utf-8"))
-            detail_msgs = await crawl_list(msg)
-            for detail_msg in detail_msgs:
-                await pub_conn.publish(QUEUE_CRAWL_DETAILPAGE, detail_msg.model_dump_json().encode("utf-8"))
-        except Exception as e:
-            crawl_logger.error(f"CrawlList loop error: {e}")
-        finally:
-            # return # 测试用,只抓取第一个列表页
-            await asyncio.sleep(2)
+async def crawl_list_page_loop(list_sub: Subscription, pub_conn: Client, concurrency: int):
+    await consume_concurrently(list_sub, concurrency, lambda msg: handle_list_page_msg(msg, pub_conn))
 
 # 爬取正文页
-async def crawl_detail_page_loop(detail_sub: Subscription, pub_conn: Client):
-    async for msg in detail_sub.messages:
-        try:
-            msg = CrawlDetailPageMsg.model_validate_json(msg.data.decode("utf-8"))
-            content_msg = await crawl_detail(msg)
-            if content_msg is not None:
-                await pub_conn.publish(QUEUE_CRAWL_PAGECONTENT, content_msg.model_dump_json().encode("utf-8"))
-        except Exception as e:
-            crawl_logger.error(f"CrawlDetail loop error: {e}")
-        finally:
-            await asyncio.sleep(2)
+async def crawl_detail_page_loop(detail_sub: Subscription, pub_conn: Client, concurrency: int):
+    await consume_concurrently(detail_sub, concurrency, lambda msg: handle_detail_page_msg(msg, pub_conn))
+
+# 并发消费订阅消息, 通过信号量限制同时处理的消息数量
+async def consume_concurrently(sub: Subscription, concurrency: int, handler: Callable[[Msg], Awaitable[None]]):
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: set[asyncio.Task] = set()
+
+    def on_done(task: asyncio.Task):
+        tasks.discard(task)
+        semaphore.release()
+
+    async for msg in sub.messages:
+        # 先占用并发名额再创建任务, 避免消息在本地无限堆积
+        await semaphore.acquire()
+        task = asyncio.create_task(handler(msg))
+        tasks.add(task)
+        task.add_done_callback(on_done)
+
+# 处理列表页消息
+async def handle_list_page_msg(msg: Msg, pub_conn: Client):
+    try:
+        msg = CrawlListPageMsg.model_validate_json(msg.data.decode("utf-8"))
+        detail_msgs, state_msg = await crawl_list(msg)
+        for detail_msg in detail_msgs:
+            await pub_conn.publish(QUEUE_CRAWL_DETAILPAGE, detail_msg.model_dump_json().encode("utf-8"))
+
+        # 只在列表页所有链接都已保存签名时记录列表页状态
+        if state_msg is not None:
+            await pub_conn.publish(QUEUE_CRAWL_LISTSTATE, state_msg.model_dump_json().encode("utf-8"))
+    except Exception as e:
+        crawl_logger.error(f"CrawlList loop error: {e}")
+
+# 处理正文页消息
+async def handle_detail_page_msg(msg: Msg, pub_conn: Client):
+    try:
+        msg = CrawlDetailPageMsg.model_validate_json(msg.data.decode("utf-8"))
+        content_msg = await crawl_detail(msg)
+        if content_msg is not None:
+            await pub_conn.publish(QUEUE_CRAWL_PAGECONTENT, content_msg.model_dump_json().encode("utf-8"))
+    except Exception as e:
+        crawl_logger.error(f"CrawlDetail loop error: {e}")
 
 # 爬取列表页
-async def crawl_list(msg: CrawlListPageMsg) -> list[CrawlDetailPageMsg]:
+async def crawl_list(msg: CrawlListPageMsg) -> tuple[list[CrawlDetailPageMsg], CrawlListStateMsg | None]:
     start_time = time.time()
-    display_url_map = {}
     match msg.crawl_list_type:
         case CrawlType.HTML_DYNAMIC:
-            pages = await crawl_list_using_browser(msg.url, msg.rule)
+            result = await crawl_list_using_browser(msg.url, msg.rule)
         case CrawlType.HTML_STATIC:
-            pages = await crawl_list_using_http(msg.url, msg.rule)
+            result = await crawl_list_using_http(msg.url, msg.rule, msg.etag, msg.last_modified)
         case CrawlType.JSON:
-            pages, display_url_map = await crawl_list_using_json(msg.url, msg.rule)
+            result = await crawl_list_using_json(msg.url, msg.rule, msg.etag, msg.last_modified)
     end_time = time.time()
-    crawl_logger.info(f"CrawlList time: {end_time - start_time:.3f}s, {msg.site_name}, {msg.url}, pages: {len(pages)}")
-    if len(pages) == 0:
-        return []
+    pages = result.pages
+    crawl_logger.info(f"CrawlList time: {end_time - start_time:.3f}s, {msg.site_name}, {msg.url}, pages: {len(pages)}, not_modified: {result.not_modified}")
+    if result.not_modified or len(pages) == 0:
+        return [], None
+
+    # 规范化后的url用于列表页签名、去重和正文页签名, 抓取仍使用原始url
+    canonical_urls = canonicalize_links(pages, msg.url_strip_params)
+    canonical_pages = {canonical_url: pages[url] for canonical_url, url in canonical_urls.items()}
+
+    # 列表页缓存状态有变化时才需要保存
+    links_hash = get_links_hash(canonical_pages)
+    state_msg = None
+    if (result.etag, result.last_modified, links_hash) != (msg.etag, msg.last_modified, msg.links_hash):
+        state_msg = CrawlListStateMsg(
+            site_id=msg.site_id,
+            etag=result.etag,
+            last_modified=result.last_modified,
+            links_hash=links_hash,
+            rule_hash=msg.rule_hash,
+        )
+
+    # 链接集合没有变化时不再去重和抓取正文页
+    if links_hash == msg.links_hash:
+        crawl_logger.info(f"CrawlList unchanged: {msg.site_name}, {msg.url}")
+        return [], state_msg
 
-    deduplicated_pages = await duplicate_url(settings.url_deduplicate_api, pages)
+    deduplicated_pages = await UrlDeduplicator.duplicate(canonical_pages)
+    if deduplicated_pages is None:
+        # 去重失败时不更新列表页状态, 下次重新抓取
+        return [], None
     crawl_logger.info(f"CrawlList deduplicated: {msg.site_name}, {msg.url}, pages: {len(deduplicated_pages)}")
     if len(deduplicated_pages) == 0:
-        return []
+        return [], state_msg
 
     detail_msgs = []
-    for url, title in deduplicated_pages.items():
+    for canonical_url, title in deduplicated_pages.items():
+        url = canonical_urls[canonical_url]
         # 当列表页爬取类型是网页时, 对于非当前域名的url(外链), 正文页爬取类型设置为html_dynamic
         if msg.crawl_list_type != CrawlType.JSON and not is_same_domain(url, msg.url): 
             crawl_detail_type = CrawlType.HTML_DYNAMIC
@@ -113,14 +201,17 @@ async def crawl_list(msg: CrawlListPageMsg) -> list[CrawlDetailPageMsg]:
                 site_id=msg.site_id,
                 site_name=msg.site_name,
                 url=url,
-                display_url=display_url_map.get(url, url),
+                display_url=result.display_urls.get(url, url),
                 title=title,
                 crawl_detail_type=crawl_detail_type,
                 first_crawl=msg.first_crawl,
                 paywall=msg.paywall,
+                canonical_url=canonical_url,
             ))
 
-    return detail_msgs
+    # 有未保存的链接时不记录列表页状态, 正文页抓取或保存失败的链接在下次调度时重新去重并抓取
+    # 所有链接的签名都已保存后再记录状态, 之后列表页未变化时可以跳过去重
+    return detail_msgs, None
 
 
 # 爬取正文页
@@ -147,6 +238,7 @@ async def crawl_detail(msg: CrawlDetailPageMsg) -> CrawlPageContentMsg | None:
         content=detail.content,
         first_crawl=msg.first_crawl,
         paywall=msg.paywall,
+        canonical_url=msg.canonical_url,
     )
 
 
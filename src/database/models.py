@@ -12,6 +12,11 @@ class CrawlType(str, Enum):
     HTML_DYNAMIC = "html_dynamic"
     JSON = "json"
 
+class PushStatus(str, Enum):
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
 class Site(models.Model):
     id = fields.IntField(primary_key=True, generated=True)
     name = fields.TextField(description="站点名称")
@@ -22,6 +27,7 @@ class Site(models.Model):
     detailpage_crawl_type = fields.CharEnumField(enum_type=CrawlType, default=CrawlType.HTML_STATIC, description="详情页爬取类型")
     content_filter_keywords = fields.TextField(default="", description="内容过滤关键词")
     paywall = fields.BooleanField(default=False, description="是否付费阅读")
+    url_strip_params = fields.JSONField(default=[], description="url规范化时额外去除的参数")
     send_to_aiagent = fields.BooleanField(default=False, description="是否用于AI agent")
     send_to_aiagent_gov = fields.BooleanField(default=False, description="治理相关")
     created_at = fields.DatetimeField(auto_now_add=True)
@@ -31,6 +37,18 @@ class Site(models.Model):
         table = "sites"
         table_description = "站点列表"
 
+class SiteListState(models.Model):
+    site_id = fields.IntField(primary_key=True, description="站点ID")
+    etag = fields.TextField(default="", description="列表页ETag")
+    last_modified = fields.TextField(default="", description="列表页Last-Modified")
+    links_hash = fields.CharField(max_length=32, default="", description="列表页链接集合的md5值")
+    rule_hash = fields.CharField(max_length=32, default="", description="保存状态时列表页地址和解析配置的md5值")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "site_list_states"
+        table_description = "站点列表页缓存状态"
+
 class Page(models.Model):
     id = fields.BigIntField(primary_key=True, generated=True)
     site: fields.ForeignKeyRelation[Site] = fields.ForeignKeyField("models.Site", related_name="pages", description="站点ID", db_index=True)
@@ -55,25 +73,90 @@ class PageContent(models.Model):
         table = "page_contents"
         table_description = "已爬取页面内容"
 
+class PageFingerprint(models.Model):
+    page_id = fields.BigIntField(primary_key=True)
+    simhash = fields.BigIntField(description="内容SimHash指纹", index=True)
+    duplicate_of = fields.BigIntField(null=True, description="近似重复的原页面ID", index=True)
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+
+    class Meta:
+        table = "page_fingerprints"
+        table_description = "已爬取页面内容指纹"
+
 class PageSignature(models.Model):
     id = fields.BigIntField(primary_key=True, generated=True)
-    signature = fields.CharField(max_length=32, description="页面url的md5值", unique=True)
+    signature = fields.BigIntField(description="页面url的md5值前8字节", unique=True)
 
     class Meta:
         table = "page_signatures"
         table_description = "已爬取页面签名"
 
+class SummaryTask(models.Model):
+    id = fields.BigIntField(primary_key=True, generated=True)
+    page_id = fields.BigIntField(description="页面ID", unique=True)
+    push = fields.BooleanField(default=False, description="摘要生成后是否推送")
+    attempts = fields.IntField(default=0, description="已重试次数")
+    next_attempt_at = fields.DatetimeField(description="下次重试时间", index=True)
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+
+    class Meta:
+        table = "summary_tasks"
+        table_description = "待重新生成摘要的页面"
+
+class LlmCacheEntry(models.Model):
+    key = fields.CharField(max_length=64, primary_key=True, description="模型、提示词版本、标题和正文的sha256值")
+    value = fields.TextField(description="大模型生成结果")
+    expires_at = fields.DatetimeField(description="过期时间", index=True)
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+
+    class Meta:
+        table = "llm_cache"
+        table_description = "大模型结果缓存"
+
 class PushSubscription(models.Model):
     id = fields.IntField(primary_key=True, generated=True)
     site_id = fields.IntField(description="站点ID", index=True)
     staff_number = fields.CharField(max_length=10, description="工号")
     filter_keywords = fields.TextField(description="过滤关键词")
+    push_weekdays = fields.JSONField(default=[0, 1, 2, 3, 4, 5, 6], description="可推送的星期, 0为周一")
+    push_start_hour = fields.IntField(default=0, description="可推送时段开始小时")
+    push_end_hour = fields.IntField(default=24, description="可推送时段结束小时(不含)")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
 
     class Meta:
         table = "push_subscriptions"
         table_description = "站点新内容推送订阅列表"
 
+class PushOutbox(models.Model):
+    id = fields.BigIntField(primary_key=True, generated=True)
+    page_id = fields.BigIntField(description="页面ID", index=True)
+    user_ids = fields.JSONField(default=[], description="待推送用户工号列表")
+    delivered_user_ids = fields.JSONField(default=[], description="已送达用户工号列表")
+    title = fields.TextField(description="标题")
+    summary = fields.TextField(description="摘要")
+    url = fields.TextField(description="URL")
+    source = fields.TextField(default="", description="来源")
+    digest = fields.BooleanField(default=False, description="是否在推送时段开始时合并为汇总消息推送")
+    status = fields.CharEnumField(enum_type=PushStatus, default=PushStatus.PENDING, description="推送状态")
+    attempts = fields.IntField(default=0, description="已发送次数")
+    next_attempt_at = fields.DatetimeField(description="下次发送时间", index=True)
+    last_error = fields.TextField(default="", description="最近一次发送错误")
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    delivered_at = fields.DatetimeField(null=True, description="送达时间")
+
+    class Meta:
+        table = "push_outbox"
+        table_description = "推送发件箱"
+
+class OssObject(models.Model):
+    key = fields.CharField(max_length=512, primary_key=True, description="OSS对象key")
+    sha256 = fields.CharField(max_length=64, description="上传内容的sha256值")
+    updated_at = fields.DatetimeField(auto_now=True, description="上传时间")
+
+    class Meta:
+        table = "oss_objects"
+        table_description = "已同步到OSS的对象"
+
 class DomainBlacklist(models.Model):
     id = fields.IntField(primary_key=True, generated=True)
     domain = fields.CharField(max_length=255, description="域名", unique=True)
@@ -99,7 +182,7 @@ class WebSearchNews(models.Model):
     company = fields.CharField(max_length=24, description="公司", index=True)
     title = fields.TextField(description="标题")
     url = fields.TextField(description="URL")
-    signature = fields.CharField(max_length=32, description="签名", index=True)
+    signature = fields.BigIntField(description="签名", index=True)
     website = fields.TextField(description="网站")
     date = fields.DatetimeField(description="日期")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
@@ -0,0 +1,189 @@
+from array import array
+import asyncio
+from bisect import bisect_left
+import heapq
+from itertools import chain
+import time
+from urllib.parse import urlparse
+from nats.aio.client import Client
+from database.models import DomainBlacklist, PageSignature
+from log.logger import server_logger
+from pubsub.connection import CONFIG_DOMAIN_BLACKLIST, SUBJECT_CONFIG_INVALIDATE
+from util.bloom import BloomFilter
+
+# 新增签名累积到该数量后合并进有序数组
+MERGE_THRESHOLD = 100000
+
+
+# 已爬取页面签名的内存索引, 启动时加载, 新增签名时更新
+# 签名保存在有序数组中, 每个签名只占8字节
+# 新增签名累积到阈值后在后台线程中与有序数组归并, 归并期间的签名仍可查询, 不阻塞事件循环
+class SignatureIndex:
+    _keys: array = array("q")
+    _recent: set[int] = set()
+    _merging: set[int] = set()
+    _merge_task: asyncio.Task | None = None
+    _reserved: set[int] = set()
+    # 签名集合变化时递增, 用于判断布隆过滤器是否需要重建
+    _version: int = 0
+
+    @classmethod
+    async def load(cls):
+        signatures = await PageSignature.all().values_list("signature", flat=True)
+        cls._keys = array("q", sorted(signatures))
+        cls._recent = set()
+        cls._merging = set()
+        cls._version += 1
+
+    @classmethod
+    def add(cls, key: int):
+        if cls.contains(key):
+            return
+        cls._recent.add(key)
+        cls._version += 1
+        if len(cls._recent) >= MERGE_THRESHOLD and (cls._merge_task is None or cls._merge_task.done()):
+            cls._merging = cls._recent
+            cls._recent = set()
+            cls._merge_task = asyncio.create_task(cls._merge())
+
+    @classmethod
+    async def _merge(cls):
+        try:
+            cls._keys = await asyncio.to_thread(_merge_sorted, cls._keys, cls._merging)
+        except Exception as e:
+            server_logger.error(f"Merge signature index error: {e}")
+            cls._recent |= cls._merging
+        cls._merging = set()
+
+    # 预占处理中页面的签名, 避免同一页面的并发消息重复生成摘要, 签名已存在或已被预占时返回False
+    @classmethod
+    def reserve(cls, key: int) -> bool:
+        if key in cls._reserved or cls.contains(key):
+            return False
+        cls._reserved.add(key)
+        return True
+
+    # 页面写入完成或处理失败后释放预占, 写入成功的签名已加入索引
+    @classmethod
+    def release(cls, key: int):
+        cls._reserved.discard(key)
+
+    @classmethod
+    def contains(cls, key: int) -> bool:
+        if key in cls._recent or key in cls._merging:
+            return True
+        position = bisect_left(cls._keys, key)
+        return position < len(cls._keys) and cls._keys[position] == key
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls._keys) + len(cls._merging) + len(cls._recent)
+
+    @classmethod
+    def version(cls) -> int:
+        return cls._version
+
+    # 签名快照, 有序数组归并时整体替换不会原地修改, 只复制新增签名集合, 可在线程中遍历
+    @classmethod
+    def snapshot(cls) -> tuple[array, set[int], set[int]]:
+        return cls._keys, set(cls._merging), set(cls._recent)
+
+
+# 两个有序序列线性归并, 逐个元素执行Python代码, 在线程中运行时会定期让出GIL
+def _merge_sorted(keys: array, recent: set[int]) -> array:
+    return array("q", heapq.merge(keys, sorted(recent)))
+
+
+# 域名黑名单内存索引, 域名按后缀匹配, 含路径等非域名条目按子串匹配
+# 黑名单修改后通过配置失效通知所有服务实例重新加载
+class DomainBlacklistIndex:
+    _domains: set[str] = set()
+    _patterns: list[str] = []
+    _conn: Client | None = None
+
+    @classmethod
+    async def load(cls):
+        cls._domains = set()
+        cls._patterns = []
+        for domain in await DomainBlacklist.all().values_list("domain", flat=True):
+            cls.add(domain)
+
+    # 只处理域名黑名单的失效通知, 不使用队列组, 每个服务实例都会收到
+    @classmethod
+    async def listen(cls, sub_conn: Client):
+        cls._conn = sub_conn
+        sub = await sub_conn.subscribe(SUBJECT_CONFIG_INVALIDATE)
+        async for msg in sub.messages:
+            if msg.data != CONFIG_DOMAIN_BLACKLIST:
+                continue
+            try:
+                await cls.load()
+                server_logger.info(f"Domain blacklist reloaded, domains: {len(cls._domains)}, patterns: {len(cls._patterns)}")
+            except Exception as e:
+                server_logger.error(f"Reload domain blacklist error: {e}")
+
+    # 黑名单修改后调用, 重新加载本实例索引并通知其他实例
+    @classmethod
+    async def invalidate(cls):
+        await cls.load()
+        if cls._conn is not None and not cls._conn.is_closed:
+            await cls._conn.publish(SUBJECT_CONFIG_INVALIDATE, CONFIG_DOMAIN_BLACKLIST)
+
+    @classmethod
+    def add(cls, domain: str):
+        domain = domain.strip().lower()
+        if not domain:
+            return
+        if "." in domain and all(c.isalnum() or c in ".-" for c in domain):
+            cls._domains.add(domain)
+        elif domain not in cls._patterns:
+            cls._patterns.append(domain)
+
+    @classmethod
+    def is_blocked(cls, url: str) -> bool:
+        host = (urlparse(url).hostname or "").lower()
+
+        # 依次检查域名本身及其各级父域名
+        while host:
+            if host in cls._domains:
+                return True
+            _, _, host = host.partition(".")
+
+        url = url.lower()
+        return any(pattern in url for pattern in cls._patterns)
+
+
+# 已爬取页面签名的布隆过滤器, 供爬虫worker定期下载, 在本地过滤已爬取的url
+class SignatureBloom:
+    _data: bytes = b""
+    _built_at: float = 0
+    _version: int = -1
+    _lock = asyncio.Lock()
+
+    # 超过缓存时间且签名有变化时才重建
+    @classmethod
+    def _fresh(cls, ttl: int) -> bool:
+        return bool(cls._data) and (time.monotonic() - cls._built_at < ttl or cls._version == SignatureIndex.version())
+
+    @classmethod
+    async def get(cls, error_rate: float, ttl: int) -> bytes:
+        if cls._fresh(ttl):
+            return cls._data
+
+        async with cls._lock:
+            # 等待锁期间可能已被其他请求重建
+            if cls._fresh(ttl):
+                return cls._data
+
+            version = SignatureIndex.version()
+            cls._data = await asyncio.to_thread(build_bloom, *SignatureIndex.snapshot(), error_rate)
+            cls._built_at = time.monotonic()
+            cls._version = version
+            return cls._data
+
+
+def build_bloom(keys: array, merging: set[int], recent: set[int], error_rate: float) -> bytes:
+    bloom = BloomFilter.create(len(keys) + len(merging) + len(recent), error_rate)
+    for key in chain(keys, merging, recent):
+        bloom.add(key)
+    return bloom.to_bytes()
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from database.models import PageFingerprint
+from util.simhash import MASK_64, hamming_distance
+
+# 64位指纹分为4段, 海明距离不超过3的两个指纹至少有一段完全相同
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+# 近似重复内容的分段索引, 以指纹的每一段为键查找候选页面, 再比较海明距离
+class NearDuplicateIndex:
+    _bands: list[dict[int, list[tuple[int, int]]]] = [{} for _ in range(BANDS)]
+    _max_distance: int = 3
+
+    @classmethod
+    async def load(cls, window_days: int = 30, max_distance: int = 3):
+        cls._bands = [{} for _ in range(BANDS)]
+        cls._max_distance = min(max_distance, BANDS - 1)
+
+        # 只加载最近的原创页面, 重复页面指向的原页面已在索引中
+        fingerprints = await PageFingerprint.filter(
+            created_at__gte=datetime.now() - timedelta(days=window_days),
+            duplicate_of=None,
+        ).values_list("page_id", "simhash")
+        for page_id, fingerprint in fingerprints:
+            cls.add(page_id, fingerprint)
+
+    @classmethod
+    def add(cls, page_id: int, fingerprint: int):
+        for band, key in enumerate(cls._band_keys(fingerprint)):
+            cls._bands[band].setdefault(key, []).append((fingerprint, page_id))
+
+    # 查找近似重复的页面, 返回页面ID
+    @classmethod
+    def find(cls, fingerprint: int) -> int | None:
+        for band, key in enumerate(cls._band_keys(fingerprint)):
+            for candidate, page_id in cls._bands[band].get(key, []):
+                if hamming_distance(fingerprint, candidate) <= cls._max_distance:
+                    return page_id
+        return None
+
+    @staticmethod
+    def _band_keys(fingerprint: int) -> list[int]:
+        fingerprint &= MASK_64
+        return [(fingerprint >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
@@ -1,3 +1,5 @@
+import asyncio
+from dataclasses import dataclass, field
 import json
 import time
 from alibabacloud_dingtalk.oauth2_1_0.client import Client as OAuthClient
@@ -6,11 +8,26 @@ from alibabacloud_dingtalk.oauth2_1_0.models import GetAccessTokenRequest
 from alibabacloud_dingtalk.robot_1_0.models import BatchSendOTORequest, BatchSendOTOHeaders
 from alibabacloud_tea_openapi import models as open_api_models
 from alibabacloud_tea_util.models import RuntimeOptions
+from log.logger import server_logger
+
+# token过期前提前刷新的秒数
+TOKEN_REFRESH_MARGIN = 300
+
+
+# 批量发送结果, 无效用户、被限流用户和被过滤(如重复消息)的用户
+@dataclass
+class BatchSendResult:
+    invalid_user_ids: list[str] = field(default_factory=list)
+    flow_controlled_user_ids: list[str] = field(default_factory=list)
+    filtered_user_ids: list[str] = field(default_factory=list)
 
 
 class DingTalkClient:
     _token_cache: str = ""
     _token_expire: float = 0
+    _token_refresh_at: float = 0
+    _token_lock: asyncio.Lock = asyncio.Lock()
+    _refresh_task: asyncio.Task | None = None
     _robot_code: str = ""
     _accesskey_id: str = ""
     _accesskey_secret: str = ""
@@ -21,6 +38,9 @@ class DingTalkClient:
     async def init(cls, accesskey_id: str, accesskey_secret: str, robot_code: str):
         cls._token_cache = ""
         cls._token_expire = 0
+        cls._token_refresh_at = 0
+        cls._token_lock = asyncio.Lock()
+        cls._refresh_task = None
         cls._robot_code = robot_code
         cls._accesskey_id = accesskey_id
         cls._accesskey_secret = accesskey_secret
@@ -36,10 +56,17 @@ class DingTalkClient:
 
     @classmethod
     async def send_message(cls, user_id: str, title: str, summary: str, url: str, source: str = ""):
-        await cls._robot_client.batch_send_otowith_options_async(
+        await cls.send_batch_message([user_id], title, summary, url, source)
+
+    # 同一条消息批量发送给多个用户, 单次最多20个用户, 返回未送达的用户
+    @classmethod
+    async def send_batch_message(cls, user_ids: list[str], title: str, summary: str, url: str, source: str = "") -> BatchSendResult:
+        # 没有原文链接时(如汇总消息)不显示查看原文
+        link = f"**[>> 查看原文 <<]({url})**\n\n" if url else ""
+        response = await cls._robot_client.batch_send_otowith_options_async(
             request=BatchSendOTORequest(
                 msg_key="sampleMarkdown",
-                user_ids=[user_id],
+                user_ids=user_ids,
                 robot_code=cls._robot_code,
                 msg_param=json.dumps(
                     {
@@ -48,9 +75,7 @@ class DingTalkClient:
 
 <font color="#4c4c4c">{summary}</font>
 
-**[>> 查看原文 <<]({url})**
-
----
+{link}---
 
 <font color="#9c9c9c">{source}</font>""",
                     }
@@ -62,23 +87,56 @@ class DingTalkClient:
             runtime=RuntimeOptions(),
         )
 
+        body = response.body if response else None
+        return BatchSendResult(
+            invalid_user_ids=(body.invalid_staff_id_list or []) if body else [],
+            flow_controlled_user_ids=(body.flow_controlled_staff_id_list or []) if body else [],
+            filtered_user_ids=(body.filtered_staff_id_list or []) if body else [],
+        )
+
+    # 有效token直接返回不加锁; 临近过期时返回当前token并在后台刷新; 已过期时等待刷新
+    # 同一时间只有一个刷新请求, 并发调用共享刷新结果
     @classmethod
     async def get_access_token(cls):
         current_time = time.time()
+        if cls._token_cache != "" and current_time < cls._token_refresh_at:
+            return cls._token_cache
 
         if cls._token_cache != "" and current_time < cls._token_expire:
+            if cls._refresh_task is None or cls._refresh_task.done():
+                cls._refresh_task = asyncio.create_task(cls._refresh_in_background())
             return cls._token_cache
 
+        return await cls._refresh_access_token()
+
+    @classmethod
+    async def _refresh_in_background(cls):
         try:
-            res = await cls._oauth_client.get_access_token_async(
-                request=GetAccessTokenRequest(app_key=cls._accesskey_id, app_secret=cls._accesskey_secret)
-            )
+            await cls._refresh_access_token()
         except Exception as e:
-            raise Exception(f"Failed to get dingtalk accesstoken: {e}")
+            server_logger.error(str(e))
 
-        if res.body.access_token:
-            cls._token_cache = res.body.access_token
-            cls._token_expire = current_time + (res.body.expire_in or 300)
-            return cls._token_cache
-        else:
-            raise Exception(f"Failed to get dingtalk accesstoken")
\ No newline at end of file
+    @classmethod
+    async def _refresh_access_token(cls) -> str:
+        async with cls._token_lock:
+            # 等待锁期间其他协程可能已完成刷新
+            if cls._token_cache != "" and time.time() < cls._token_refresh_at:
+                return cls._token_cache
+
+            request_time = time.time()
+            try:
+                res = await cls._oauth_client.get_access_token_async(
+                    request=GetAccessTokenRequest(app_key=cls._accesskey_id, app_secret=cls._accesskey_secret)
+                )
+            except Exception as e:
+                raise Exception(f"Failed to get dingtalk accesstoken: {e}")
+
+            if res.body.access_token:
+                cls._token_cache = res.body.access_token
+                # 以请求发出的时间计算过期时间, 有效期较短时最多提前一半有效期刷新
+                expire_in = res.body.expire_in or 300
+                cls._token_expire = request_time + expire_in
+                cls._token_refresh_at = cls._token_expire - min(TOKEN_REFRESH_MARGIN, expire_in / 2)
+                return cls._token_cache
+            else:
+                raise Exception(f"Failed to get dingtalk accesstoken")
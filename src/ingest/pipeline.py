@@ -0,0 +1,193 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+from nats.aio.client import Client
+from cache.site import SiteConfigCache
+from database.models import Page, PushSubscription
+from dedupe.signature import SignatureIndex
+from dedupe.simhash import NearDuplicateIndex
+from ingest.writer import PageWrite, PageWriter
+from llm.bailian import Bailian
+from llm.gateway import LlmUnavailableError
+from log.logger import server_logger
+from pubsub.connection import QUEUE_CRAWL_PAGECONTENT
+from push.outbox import pushed_user_ids
+from push.window import PushPlan, plan_push
+from pubsub.msg import CrawlPageContentMsg
+from util.page import get_signature
+from util.simhash import simhash
+
+
+# 在流水线各阶段之间传递的页面及其处理结果
+@dataclass
+class IngestItem:
+    page_content: CrawlPageContentMsg
+    signature: int = 0
+    summary: str | None = None
+    fingerprint: int | None = None
+    duplicate_of: int | None = None
+    pending_summary: bool = False
+    written: asyncio.Future[int | None] | None = None
+    subscriptions: list[PushSubscription] = field(default_factory=list)
+
+
+# 大模型不可用时先保存的摘要, 后台重新生成后替换
+PENDING_SUMMARY = "摘要生成中，请稍后查看"
+
+
+# 阶段处理函数返回None表示该页面不再进入下一阶段
+IngestHandler = Callable[[IngestItem], Awaitable[IngestItem | None]]
+
+
+# 页面内容入库流水线: 解码 -> 过滤 -> 摘要 -> 保存, 推送消息随页面写入发件箱, 由后台分发
+# 阶段之间使用有界队列连接, 每个阶段独立设置并发数, 慢阶段通过队列阻塞上游形成背压
+class IngestPipeline:
+    _tasks: list[asyncio.Task] = []
+    _skip_duplicate_push: bool = False
+    _min_fingerprint_length: int = 200
+
+    @classmethod
+    def start(
+        cls,
+        sub_conn: Client,
+        queue_size: int = 100,
+        filter_concurrency: int = 4,
+        summarize_concurrency: int = 8,
+        persist_concurrency: int = 4,
+        min_fingerprint_length: int = 200,
+        skip_duplicate_push: bool = False,
+    ):
+        cls._min_fingerprint_length = min_fingerprint_length
+        cls._skip_duplicate_push = skip_duplicate_push
+
+        filter_queue: asyncio.Queue[IngestItem] = asyncio.Queue(maxsize=queue_size)
+        summarize_queue: asyncio.Queue[IngestItem] = asyncio.Queue(maxsize=queue_size)
+        persist_queue: asyncio.Queue[IngestItem] = asyncio.Queue(maxsize=queue_size)
+
+        stages: list[tuple[str, int, asyncio.Queue, IngestHandler, asyncio.Queue | None]] = [
+            ("filter", filter_concurrency, filter_queue, cls._filter, summarize_queue),
+            ("summarize", summarize_concurrency, summarize_queue, cls._summarize, persist_queue),
+            ("persist", persist_concurrency, persist_queue, cls._persist, None),
+        ]
+
+        cls._tasks = [asyncio.create_task(cls._read(sub_conn, filter_queue))]
+        for name, concurrency, inbox, handler, outbox in stages:
+            for _ in range(max(1, concurrency)):
+                cls._tasks.append(asyncio.create_task(cls._run_stage(name, inbox, handler, outbox)))
+
+    @classmethod
+    async def shutdown(cls):
+        for task in cls._tasks:
+            task.cancel()
+        await asyncio.gather(*cls._tasks, return_exceptions=True)
+        cls._tasks = []
+
+    # 解码消息, 过滤队列已满时暂停读取
+    @classmethod
+    async def _read(cls, sub_conn: Client, outbox: asyncio.Queue[IngestItem]):
+        sub = await sub_conn.subscribe(QUEUE_CRAWL_PAGECONTENT, queue="workers")
+        async for msg in sub.messages:
+            try:
+                page_content = CrawlPageContentMsg.model_validate_json(msg.data.decode("utf-8"))
+            except Exception as e:
+                server_logger.error(f"Decode crawl page content error: {e}")
+                continue
+            await outbox.put(IngestItem(page_content=page_content))
+
+    @classmethod
+    async def _run_stage(cls, name: str, inbox: asyncio.Queue[IngestItem], handler: IngestHandler, outbox: asyncio.Queue[IngestItem] | None):
+        while True:
+            item = await inbox.get()
+            try:
+                result = await handler(item)
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+            except Exception as e:
+                server_logger.error(f"Ingest {name} error: {item.page_content.url} {e}")
+                SignatureIndex.release(item.signature)
+            finally:
+                inbox.task_done()
+
+    # 过滤已保存的页面, 未命中站点过滤关键词的页面只记录签名, 近似重复的页面复用已有摘要
+    @classmethod
+    async def _filter(cls, item: IngestItem) -> IngestItem | None:
+        page_content = item.page_content
+
+        signature = get_signature(page_content.canonical_url or page_content.url)
+        if not SignatureIndex.reserve(signature):
+            return None
+        item.signature = signature
+
+        # 一次匹配同时得到站点过滤结果和命中推送过滤关键词的订阅
+        site_hit, item.subscriptions = await SiteConfigCache.match(page_content.site_id, page_content.title, page_content.content)
+        if not site_hit:
+            # 无条件记录页面签名，用于去重, 不等待写入完成
+            written = await PageWriter.submit(PageWrite(page_content, signature, save_page=False))
+            written.add_done_callback(lambda _: SignatureIndex.release(signature))
+            return None
+
+        if page_content.paywall:
+            item.summary = "网站包含付费订阅内容，请查看原文"
+        elif len(page_content.content) >= cls._min_fingerprint_length:
+            item.fingerprint = await asyncio.to_thread(simhash, page_content.content)
+            duplicate_of = NearDuplicateIndex.find(item.fingerprint)
+            if duplicate_of is not None:
+                duplicate_page = await Page.get_or_none(id=duplicate_of).only("summary")
+                if duplicate_page is not None:
+                    item.summary = duplicate_page.summary
+                    item.duplicate_of = duplicate_of
+                    server_logger.info(f"Near duplicate of page {duplicate_of}: {page_content.title}")
+        return item
+
+    @classmethod
+    async def _summarize(cls, item: IngestItem) -> IngestItem | None:
+        if item.summary is None:
+            try:
+                item.summary = await Bailian.text_summary(item.page_content.title, item.page_content.content)
+            except LlmUnavailableError as e:
+                # 大模型不可用时先保存页面, 摘要由后台重新生成
+                server_logger.error(f"Summary pending: {item.page_content.url} {e}")
+                item.summary = PENDING_SUMMARY
+                item.pending_summary = True
+        return item
+
+    @classmethod
+    async def _persist(cls, item: IngestItem) -> IngestItem | None:
+        page_content = item.page_content
+
+        # 首次爬取数据量大, 不进行推送
+        push = not page_content.first_crawl
+        subscriptions = item.subscriptions
+        # 近似重复的内容只跳过已收到原页面推送的用户, 原页面可能来自其他站点、未推送或订阅用户不同
+        if push and item.duplicate_of is not None and cls._skip_duplicate_push and subscriptions:
+            pushed = await pushed_user_ids(item.duplicate_of)
+            subscriptions = [subscription for subscription in subscriptions if subscription.staff_number not in pushed]
+        # 摘要待重新生成的页面在摘要生成后再写入发件箱
+        plan = plan_push(subscriptions) if push and not item.pending_summary else PushPlan()
+
+        # 只加入批量写入队列, 不等待写入完成
+        item.written = await PageWriter.submit(PageWrite(
+            page_content,
+            item.signature,
+            save_page=True,
+            summary=item.summary,
+            fingerprint=item.fingerprint,
+            duplicate_of=item.duplicate_of,
+            pending_summary=item.pending_summary,
+            push_later=push and item.pending_summary,
+            push_user_ids=plan.user_ids,
+            deferred_pushes=plan.deferred,
+        ))
+        signature = item.signature
+        item.written.add_done_callback(lambda _: SignatureIndex.release(signature))
+
+        # 摘要生成失败或待重新生成的页面不作为复用来源
+        if item.fingerprint is not None and item.duplicate_of is None and not item.pending_summary and "大模型生成摘要失败" not in item.summary:
+            fingerprint = item.fingerprint
+
+            def add_to_index(future: asyncio.Future[int | None]):
+                if future.result() is not None:
+                    NearDuplicateIndex.add(future.result(), fingerprint)
+
+            item.written.add_done_callback(add_to_index)
+        return None
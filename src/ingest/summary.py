@@ -0,0 +1,107 @@
+import asyncio
+from datetime import timedelta
+from tortoise import connections, timezone
+from tortoise.transactions import in_transaction
+from cache.site import SiteConfigCache
+from database.models import Page, PageContent, PageFingerprint, PushOutbox, SummaryTask
+from dedupe.simhash import NearDuplicateIndex
+from llm.bailian import Bailian
+from llm.gateway import LlmUnavailableError
+from log.logger import server_logger
+from push.outbox import OutboxDispatcher
+from push.window import PushPlan, plan_push
+
+# 领取任务后的租约时间, 处理中断的任务在租约过期后可被重新领取
+CLAIM_LEASE = timedelta(minutes=10)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+# 多个服务实例同时运行时, 跳过已被其他实例锁定的任务
+CLAIM_SUMMARY_TASKS_SQL = """
+UPDATE summary_tasks SET next_attempt_at = $2
+WHERE id IN (
+    SELECT id FROM summary_tasks
+    WHERE next_attempt_at <= $1
+    ORDER BY next_attempt_at
+    LIMIT $3
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, page_id, push, attempts
+"""
+
+
+# 大模型不可用时保存的页面, 定期重新生成摘要, 生成后替换占位摘要并将推送消息写入发件箱
+class SummaryRetryWorker:
+    _batch_size: int = 20
+    _retry_delay: timedelta = timedelta(minutes=1)
+
+    @classmethod
+    async def run(cls, interval: int = 60, batch_size: int = 20):
+        cls._batch_size = batch_size
+        cls._retry_delay = timedelta(seconds=interval)
+        while True:
+            try:
+                await cls.retry_pending()
+            except Exception as e:
+                server_logger.error(f"Retry pending summary error: {e}")
+            await asyncio.sleep(interval)
+
+    @classmethod
+    async def retry_pending(cls):
+        now = timezone.now()
+        _, tasks = await connections.get("default").execute_query(CLAIM_SUMMARY_TASKS_SQL, [now, now + CLAIM_LEASE, cls._batch_size])
+        for task in tasks:
+            page = await Page.get_or_none(id=task["page_id"])
+            if page is None:
+                await SummaryTask.filter(id=task["id"]).delete()
+                continue
+            page_content = await PageContent.get_or_none(page_id=page.id)
+            content = page_content.content if page_content else ""
+
+            try:
+                summary = await Bailian.text_summary(page.title, content)
+            except LlmUnavailableError as e:
+                # 指数退避, 大模型仍不可用时本批剩余任务等租约过期后再处理
+                delay = min(MAX_RETRY_DELAY, cls._retry_delay * 2 ** task["attempts"])
+                await SummaryTask.filter(id=task["id"]).update(attempts=task["attempts"] + 1, next_attempt_at=timezone.now() + delay)
+                server_logger.error(f"Retry summary failed: page {page.id}, attempts: {task['attempts'] + 1}, {e}")
+                return
+
+            plan = PushPlan()
+            if task["push"]:
+                _, subscriptions = await SiteConfigCache.match(page.site_id, page.title, content)
+                plan = plan_push(subscriptions)
+
+            async with in_transaction():
+                await Page.filter(id=page.id).update(summary=summary)
+                await SummaryTask.filter(id=task["id"]).delete()
+                if plan.user_ids or plan.deferred:
+                    site = await SiteConfigCache.get_site(page.site_id)
+                if plan.user_ids:
+                    await PushOutbox.create(
+                        page_id=page.id,
+                        user_ids=plan.user_ids,
+                        title=page.title,
+                        summary=summary,
+                        url=page.display_url,
+                        source=site.name,
+                        next_attempt_at=timezone.now(),
+                    )
+                # 不在推送时段内的用户写入汇总消息
+                for user_id, deliver_at in plan.deferred.items():
+                    await PushOutbox.create(
+                        page_id=page.id,
+                        user_ids=[user_id],
+                        title=page.title,
+                        summary="",
+                        url=page.display_url,
+                        source=site.name,
+                        digest=True,
+                        next_attempt_at=deliver_at,
+                    )
+            server_logger.info(f"Summary regenerated: page {page.id}")
+            if plan.user_ids:
+                OutboxDispatcher.notify()
+
+            fingerprint = await PageFingerprint.get_or_none(page_id=page.id)
+            if fingerprint is not None and fingerprint.duplicate_of is None and "大模型生成摘要失败" not in summary:
+                NearDuplicateIndex.add(page.id, fingerprint.simhash)
@@ -0,0 +1,231 @@
+import asyncio
+from datetime import datetime
+import json
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+from database.models import Page
+from dedupe.signature import SignatureIndex
+from log.logger import server_logger
+from push.outbox import OutboxDispatcher
+from pubsub.msg import CrawlPageContentMsg
+
+INSERT_SIGNATURES_SQL = """
+INSERT INTO page_signatures (signature)
+SELECT unnest($1::bigint[])
+ON CONFLICT (signature) DO NOTHING
+RETURNING id, signature
+"""
+
+INSERT_PAGES_SQL = """
+INSERT INTO pages (site_id, title, url, display_url, summary, date, signature_id, visible, created_at)
+SELECT * FROM unnest($1::int[], $2::text[], $3::text[], $4::text[], $5::text[], $6::timestamptz[], $7::bigint[], $8::bool[], $9::timestamptz[])
+RETURNING id, signature_id
+"""
+
+INSERT_CONTENTS_SQL = """
+INSERT INTO page_contents (page_id, content)
+SELECT * FROM unnest($1::bigint[], $2::text[])
+"""
+
+INSERT_SUMMARY_TASKS_SQL = """
+INSERT INTO summary_tasks (page_id, push, attempts, next_attempt_at, created_at)
+SELECT page_id, push, 0, $3::timestamptz, $3::timestamptz FROM unnest($1::bigint[], $2::bool[]) AS t(page_id, push)
+"""
+
+INSERT_PUSH_OUTBOX_SQL = """
+INSERT INTO push_outbox (page_id, user_ids, delivered_user_ids, title, summary, url, source, status, attempts, next_attempt_at, last_error, created_at)
+SELECT page_id, user_ids::jsonb, '[]'::jsonb, title, summary, url, source, 'pending', 0, $7::timestamptz, '', $7::timestamptz
+FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::text[], $6::text[]) AS t(page_id, user_ids, title, summary, url, source)
+"""
+
+# 不在推送时段内的用户, 每个用户一条汇总消息, 到推送时段开始时间后发送
+INSERT_PUSH_DIGEST_SQL = """
+INSERT INTO push_outbox (page_id, user_ids, delivered_user_ids, title, summary, url, source, digest, status, attempts, next_attempt_at, last_error, created_at)
+SELECT page_id, jsonb_build_array(user_id), '[]'::jsonb, title, '', url, source, TRUE, 'pending', 0, next_attempt_at, '', $7::timestamptz
+FROM unnest($1::bigint[], $2::text[], $3::timestamptz[], $4::text[], $5::text[], $6::text[]) AS t(page_id, user_id, next_attempt_at, title, url, source)
+"""
+
+INSERT_FINGERPRINTS_SQL = """
+INSERT INTO page_fingerprints (page_id, simhash, duplicate_of, created_at)
+SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::timestamptz[])
+"""
+
+
+# 待写入的页面, save_page为False时只记录签名
+# pending_summary为True时同时写入摘要重试任务, 由后台重新生成摘要, push_later表示摘要生成后需要推送
+# push_user_ids不为空时同时写入推送发件箱, deferred_pushes为不在推送时段内的用户及其推送时间, 写入汇总消息
+class PageWrite:
+    def __init__(self, page_content: CrawlPageContentMsg, signature: int, save_page: bool, summary: str = "", fingerprint: int | None = None, duplicate_of: int | None = None, pending_summary: bool = False, push_later: bool = False, push_user_ids: list[str] | None = None, deferred_pushes: dict[str, datetime] | None = None):
+        self.page_content = page_content
+        self.signature = signature
+        self.save_page = save_page
+        self.summary = summary
+        self.fingerprint = fingerprint
+        self.duplicate_of = duplicate_of
+        self.pending_summary = pending_summary
+        self.push_later = push_later
+        self.push_user_ids = push_user_ids or []
+        self.deferred_pushes = deferred_pushes or {}
+        self.future: asyncio.Future[int | None] = asyncio.get_running_loop().create_future()
+
+
+# 页面批量写入器, 累积到batch_size条或等待flush_interval后, 在一个事务中批量写入签名、页面、内容、指纹和推送消息
+# 签名已存在(其他实例已写入)的页面不再写入, 事务失败时整批回滚, 不会出现只写入一半的页面
+# 批次写入失败时拆分为两半重试, 直到定位到写入失败的单条页面, 避免一条异常数据导致整批丢失
+class PageWriter:
+    _queue: asyncio.Queue[PageWrite] | None = None
+    _task: asyncio.Task | None = None
+    _batch_size: int = 200
+    _flush_interval: float = 0.2
+
+    @classmethod
+    def init(cls, batch_size: int = 200, flush_interval: float = 0.2):
+        cls._batch_size = batch_size
+        cls._flush_interval = flush_interval
+        cls._queue = asyncio.Queue(maxsize=batch_size * 4)
+        cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def shutdown(cls):
+        if cls._task is not None:
+            cls._task.cancel()
+            await asyncio.gather(cls._task, return_exceptions=True)
+            cls._task = None
+
+        # 写入队列中剩余的页面
+        if cls._queue is not None:
+            batch = []
+            while not cls._queue.empty():
+                batch.append(cls._queue.get_nowait())
+            if batch:
+                await cls._flush(batch)
+            cls._queue = None
+
+    # 加入写入队列, 返回的future在写入完成后得到页面ID, 只记录签名或签名已存在时为None
+    @classmethod
+    async def submit(cls, write: PageWrite) -> asyncio.Future[int | None]:
+        if cls._queue is None:
+            raise RuntimeError("Page writer not initialized")
+        await cls._queue.put(write)
+        return write.future
+
+    @classmethod
+    async def _run(cls):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await cls._queue.get()]
+            deadline = loop.time() + cls._flush_interval
+            while len(batch) < cls._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(cls._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await cls._flush(batch)
+
+    @classmethod
+    async def _flush(cls, batch: list[PageWrite]):
+        page_ids: dict[int, int] = {}
+        try:
+            page_ids = await cls._write(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                server_logger.error(f"Write pages error, split batch of {len(batch)}, {e}")
+                middle = len(batch) // 2
+                await cls._flush(batch[:middle])
+                await cls._flush(batch[middle:])
+            else:
+                server_logger.error(f"Write page error: {batch[0].page_content.url} {e}")
+        finally:
+            for write in batch:
+                if not write.future.done():
+                    write.future.set_result(page_ids.get(id(write)))
+
+    # 返回批次中成功写入的页面ID, 以PageWrite对象的id为键
+    @classmethod
+    async def _write(cls, batch: list[PageWrite]) -> dict[int, int]:
+        # 同一批次中重复的签名只保留第一条
+        writes: dict[int, PageWrite] = {}
+        for write in batch:
+            writes.setdefault(write.signature, write)
+
+        created_at = timezone.now()
+        date_field = Page._meta.fields_map["date"]
+        created_at_value = Page._meta.fields_map["created_at"].to_db_value(created_at, Page)
+
+        async with in_transaction() as conn:
+            _, rows = await conn.execute_query(INSERT_SIGNATURES_SQL, [list(writes.keys())])
+            signature_ids = {row["signature"]: row["id"] for row in rows}
+
+            page_writes = [(signature_ids[signature], write) for signature, write in writes.items() if write.save_page and signature in signature_ids]
+            page_ids: dict[int, int] = {}
+            if page_writes:
+                page_contents = [write.page_content for _, write in page_writes]
+                _, rows = await conn.execute_query(INSERT_PAGES_SQL, [
+                    [page_content.site_id for page_content in page_contents],
+                    [page_content.title for page_content in page_contents],
+                    [page_content.url for page_content in page_contents],
+                    [page_content.display_url if page_content.display_url != "" else page_content.url for page_content in page_contents],
+                    [write.summary for _, write in page_writes],
+                    [date_field.to_db_value(date_field.to_python_value(page_content.date), Page) for page_content in page_contents],
+                    [signature_id for signature_id, _ in page_writes],
+                    [True] * len(page_writes),
+                    [created_at_value] * len(page_writes),
+                ])
+                signature_page_ids = {row["signature_id"]: row["id"] for row in rows}
+                page_ids = {id(write): signature_page_ids[signature_id] for signature_id, write in page_writes}
+
+                await conn.execute_query(INSERT_CONTENTS_SQL, [
+                    [page_ids[id(write)] for _, write in page_writes],
+                    [write.page_content.content for _, write in page_writes],
+                ])
+
+                summary_task_writes = [write for _, write in page_writes if write.pending_summary]
+                if summary_task_writes:
+                    await conn.execute_query(INSERT_SUMMARY_TASKS_SQL, [
+                        [page_ids[id(write)] for write in summary_task_writes],
+                        [write.push_later for write in summary_task_writes],
+                        created_at_value,
+                    ])
+
+                push_writes = [write for _, write in page_writes if write.push_user_ids]
+                if push_writes:
+                    await conn.execute_query(INSERT_PUSH_OUTBOX_SQL, [
+                        [page_ids[id(write)] for write in push_writes],
+                        [json.dumps(write.push_user_ids) for write in push_writes],
+                        [write.page_content.title for write in push_writes],
+                        [write.summary for write in push_writes],
+                        [write.page_content.display_url if write.page_content.display_url != "" else write.page_content.url for write in push_writes],
+                        [write.page_content.site_name for write in push_writes],
+                        created_at_value,
+                    ])
+
+                digest_rows = [(write, user_id, deliver_at) for _, write in page_writes for user_id, deliver_at in write.deferred_pushes.items()]
+                if digest_rows:
+                    await conn.execute_query(INSERT_PUSH_DIGEST_SQL, [
+                        [page_ids[id(write)] for write, _, _ in digest_rows],
+                        [user_id for _, user_id, _ in digest_rows],
+                        [deliver_at for _, _, deliver_at in digest_rows],
+                        [write.page_content.title for write, _, _ in digest_rows],
+                        [write.page_content.display_url if write.page_content.display_url != "" else write.page_content.url for write, _, _ in digest_rows],
+                        [write.page_content.site_name for write, _, _ in digest_rows],
+                        created_at_value,
+                    ])
+
+                fingerprint_writes = [write for _, write in page_writes if write.fingerprint is not None]
+                if fingerprint_writes:
+                    await conn.execute_query(INSERT_FINGERPRINTS_SQL, [
+                        [page_ids[id(write)] for write in fingerprint_writes],
+                        [write.fingerprint for write in fingerprint_writes],
+                        [write.duplicate_of for write in fingerprint_writes],
+                        [created_at_value] * len(fingerprint_writes),
+                    ])
+
+        # 事务提交后更新签名索引, 包括已被其他实例写入的签名
+        for signature in writes:
+            SignatureIndex.add(signature)
+        if any(write.push_user_ids for write in writes.values()):
+            OutboxDispatcher.notify()
+        return page_ids
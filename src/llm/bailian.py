@@ -1,11 +1,45 @@
 import asyncio
+import hashlib
 from http import HTTPStatus
+import json
+from typing import AsyncIterator
+import aiohttp
 import dashscope
 from dashscope.api_entities.dashscope_response import Message
+from llm.cache import LlmCache
+from llm.gateway import LlmGateway, LlmStatusError
+from llm.token import estimate_tokens, normalize_text, split_chunks, trim_to_tokens
+from util.http import HttpClient
+
+DASHSCOPE_API_URL = "https://dashscope.aliyuncs.com/api/v1"
+
+# 百炼应用错误事件没有状态码时, 按错误码前缀对应的HTTP状态码, 决定是否重试
+DASHSCOPE_ERROR_STATUS = [
+    ("Throttling", HTTPStatus.TOO_MANY_REQUESTS),
+    ("InternalError", HTTPStatus.INTERNAL_SERVER_ERROR),
+    ("SystemError", HTTPStatus.INTERNAL_SERVER_ERROR),
+    ("ServiceUnavailable", HTTPStatus.SERVICE_UNAVAILABLE),
+    ("RequestTimeOut", HTTPStatus.GATEWAY_TIMEOUT),
+    ("InvalidApiKey", HTTPStatus.UNAUTHORIZED),
+    ("AccessDenied", HTTPStatus.FORBIDDEN),
+    ("Arrearage", HTTPStatus.FORBIDDEN),
+    ("NotFound", HTTPStatus.NOT_FOUND),
+    ("ModelNotFound", HTTPStatus.NOT_FOUND),
+]
 
 class Bailian:
     _api_key: str = ""
     _interpretation_app_id: str = ""
+    _summary_input_tokens: int = 6000
+    _summary_chunk_tokens: int = 4000
+    _summary_max_chunks: int = 8
+    _interpretation_input_tokens: int = 16000
+
+    summary_model = "qwen-turbo"
+    # 预估的输出token数, 用于每分钟token数限流
+    output_tokens = 1000
+    # 解读提示词配置在百炼应用中, 修改应用提示词后需要更新版本号使缓存失效
+    interpretation_prompt_version = "1"
 
     summary_prompt = """
 # 角色
@@ -24,10 +58,20 @@ class Bailian:
 - 禁止输出摘要这两个字，只输出摘要的内容
 - 不允许偷懒，需要全面准确，不能敷衍了事。如果内容有问题无法生成摘要，请返回'大模型生成摘要失败，请查看原文'"""
 
+    # 超长文章分段提取要点
+    chunk_prompt = """你是新闻编辑，下面是一篇长文章的其中一部分。请提取这部分内容的要点，保留关键事实、数据、时间、主体和政策条款，可以直接引用原文，不自己杜撰任何内容，不输出与内容无关的说明。"""
+
+    # 摘要提示词修改后缓存自动失效
+    summary_prompt_version = hashlib.sha256((summary_prompt + chunk_prompt).encode()).hexdigest()[:16]
+
     @classmethod
-    def init(cls, api_key: str, interpretation_app_id: str):
+    def init(cls, api_key: str, interpretation_app_id: str, summary_input_tokens: int = 6000, summary_chunk_tokens: int = 4000, summary_max_chunks: int = 8, interpretation_input_tokens: int = 16000):
         cls._api_key = api_key
         cls._interpretation_app_id = interpretation_app_id
+        cls._summary_input_tokens = summary_input_tokens
+        cls._summary_chunk_tokens = summary_chunk_tokens
+        cls._summary_max_chunks = summary_max_chunks
+        cls._interpretation_input_tokens = interpretation_input_tokens
 
 
     @classmethod
@@ -44,42 +88,200 @@ class Bailian:
         else:
             return res.output.text
 
+    # 调用失败重试耗尽或熔断时抛出LlmUnavailableError
     @classmethod
     async def text_summary(cls, title: str, content: str) -> str:
         if content == "":
             return "文章内容采集失败，请查看原文"
 
-        response = await dashscope.AioGeneration.call(
-            api_key=cls._api_key,
-            model="qwen-turbo",
-            messages=[
-                Message(
-                    role="system",
-                    content=cls.summary_prompt,
-                ),
-                Message(
-                    role="user",
-                    content=f"网页内容如下：\n\n标题：\n{title}\n\n正文：\n{content}",
-                ),
-            ],
-            stream=False,
-            result_format="text",
-        )
+        cache_key = LlmCache.key(cls.summary_model, cls.summary_prompt_version, title, content)
+        cached = await LlmCache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            query = await cls._summary_query(title, content)
+        except LlmStatusError as e:
+            return f"大模型生成摘要失败，响应码: {e.status_code}, 错误信息: {e.message}"
+
+        response = await cls._generate(cls.summary_prompt, query)
         if response.status_code != HTTPStatus.OK:
             return f"大模型生成摘要失败，响应码: {response.status_code}, 错误信息: {response.message}"
         else:
+            # 只缓存成功生成的摘要
+            if "大模型生成摘要失败" not in response.output.text:
+                await LlmCache.set(cache_key, response.output.text)
             return response.output.text
 
+    # 流式生成摘要, 逐段返回增量文本, 调用失败重试耗尽或熔断时抛出LlmUnavailableError
     @classmethod
-    async def rag_interpretation(cls, title: str, content: str) -> str:
-        query = f"""网页markdown内容如下：\n\n标题：\n{title}\n\n正文：\n{content}"""
-        response = await asyncio.to_thread(dashscope.Application.call,
-            app_id=cls._interpretation_app_id,
+    async def stream_summary(cls, title: str, content: str) -> AsyncIterator[str]:
+        if content == "":
+            yield "文章内容采集失败，请查看原文"
+            return
+
+        cache_key = LlmCache.key(cls.summary_model, cls.summary_prompt_version, title, content)
+        cached = await LlmCache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        try:
+            query = await cls._summary_query(title, content)
+            async for text in LlmGateway.stream(
+                lambda: cls._generate_stream(cls.summary_prompt, query),
+                tokens=estimate_tokens(cls.summary_prompt + query) + cls.output_tokens,
+            ):
+                parts.append(text)
+                yield text
+        except LlmStatusError as e:
+            yield f"大模型生成摘要失败，响应码: {e.status_code}, 错误信息: {e.message}"
+            return
+
+        summary = "".join(parts)
+        if summary and "大模型生成摘要失败" not in summary:
+            await LlmCache.set(cache_key, summary)
+
+    # 生成摘要的请求内容, 超长文章分段并发提取要点后以要点代替正文, 超过最大分段数的内容截断
+    @classmethod
+    async def _summary_query(cls, title: str, content: str) -> str:
+        content = normalize_text(content)
+        if estimate_tokens(content) <= cls._summary_input_tokens:
+            return f"网页内容如下：\n\n标题：\n{title}\n\n正文：\n{content}"
+
+        content = trim_to_tokens(content, cls._summary_chunk_tokens * cls._summary_max_chunks)
+        chunks = split_chunks(content, cls._summary_chunk_tokens)
+        responses = await asyncio.gather(*(
+            cls._generate(cls.chunk_prompt, f"文章标题：{title}\n\n第{index + 1}/{len(chunks)}部分内容如下：\n{chunk}")
+            for index, chunk in enumerate(chunks)
+        ))
+        for response in responses:
+            if response.status_code != HTTPStatus.OK:
+                raise LlmStatusError(response.status_code, response.message)
+
+        points = "\n\n".join(f"第{index + 1}部分要点：\n{response.output.text}" for index, response in enumerate(responses))
+        return f"网页内容较长，已分段提取要点如下：\n\n标题：\n{title}\n\n正文要点：\n{points}"
+
+    @classmethod
+    async def _generate(cls, system_prompt: str, query: str):
+        return await LlmGateway.call(
+            lambda: dashscope.AioGeneration.call(
+                api_key=cls._api_key,
+                model=cls.summary_model,
+                messages=cls._messages(system_prompt, query),
+                stream=False,
+                result_format="text",
+            ),
+            tokens=estimate_tokens(system_prompt + query) + cls.output_tokens,
+        )
+
+    # 增量输出, 每次只返回新生成的文本
+    @classmethod
+    async def _generate_stream(cls, system_prompt: str, query: str) -> AsyncIterator[str]:
+        responses = await dashscope.AioGeneration.call(
             api_key=cls._api_key,
-            prompt=query,
-            stream=False,
+            model=cls.summary_model,
+            messages=cls._messages(system_prompt, query),
+            stream=True,
+            incremental_output=True,
+            result_format="text",
+        )
+        async for response in responses:
+            if response.status_code != HTTPStatus.OK:
+                raise LlmStatusError(response.status_code, response.message)
+            yield response.output.text
+
+    @staticmethod
+    def _messages(system_prompt: str, query: str) -> list[Message]:
+        return [
+            Message(
+                role="system",
+                content=system_prompt,
+            ),
+            Message(
+                role="user",
+                content=query,
+            ),
+        ]
+
+    # 调用失败重试耗尽或熔断时抛出LlmUnavailableError
+    @classmethod
+    async def rag_interpretation(cls, title: str, content: str) -> str:
+        cache_key = LlmCache.key(cls._interpretation_app_id, cls.interpretation_prompt_version, title, content)
+        cached = await LlmCache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        query = cls._interpretation_query(title, content)
+        response = await LlmGateway.call(
+            lambda: asyncio.to_thread(dashscope.Application.call,
+                app_id=cls._interpretation_app_id,
+                api_key=cls._api_key,
+                prompt=query,
+                stream=False,
+            ),
+            tokens=estimate_tokens(query) + cls.output_tokens,
         )
         if response.status_code != HTTPStatus.OK:
             return f"大模型调用失败，响应码: {response.status_code}, 错误信息: {response.message}"
         else:
+            await LlmCache.set(cache_key, response.output.text)
             return response.output.text
+
+    # 流式生成解读, 直接调用百炼应用的SSE接口, 不占用线程
+    @classmethod
+    async def stream_interpretation(cls, title: str, content: str) -> AsyncIterator[str]:
+        cache_key = LlmCache.key(cls._interpretation_app_id, cls.interpretation_prompt_version, title, content)
+        cached = await LlmCache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        query = cls._interpretation_query(title, content)
+        parts = []
+        try:
+            async for text in LlmGateway.stream(
+                lambda: cls._app_stream(cls._interpretation_app_id, query),
+                tokens=estimate_tokens(query) + cls.output_tokens,
+            ):
+                parts.append(text)
+                yield text
+        except LlmStatusError as e:
+            yield f"大模型调用失败，响应码: {e.status_code}, 错误信息: {e.message}"
+            return
+
+        interpretation = "".join(parts)
+        if interpretation:
+            await LlmCache.set(cache_key, interpretation)
+
+    @classmethod
+    def _interpretation_query(cls, title: str, content: str) -> str:
+        content = trim_to_tokens(normalize_text(content), cls._interpretation_input_tokens)
+        return f"""网页markdown内容如下：\n\n标题：\n{title}\n\n正文：\n{content}"""
+
+    @classmethod
+    async def _app_stream(cls, app_id: str, prompt: str) -> AsyncIterator[str]:
+        try:
+            async for data in HttpClient.post_sse(
+                f"{DASHSCOPE_API_URL}/apps/{app_id}/completion",
+                {"input": {"prompt": prompt}, "parameters": {"incremental_output": True}, "debug": {}},
+                headers={"Authorization": f"Bearer {cls._api_key}", "X-DashScope-SSE": "enable"},
+            ):
+                event = json.loads(data)
+                if "output" not in event:
+                    raise LlmStatusError(cls._error_status(event), event.get("message", ""))
+                yield event["output"].get("text") or ""
+        except aiohttp.ClientResponseError as e:
+            raise LlmStatusError(e.status, e.message)
+
+    # 错误事件的状态码, 未知错误码(如参数错误、内容审核不通过)按请求错误处理, 不重试
+    @staticmethod
+    def _error_status(event: dict) -> int:
+        if event.get("status_code"):
+            return int(event["status_code"])
+        code = str(event.get("code", ""))
+        for prefix, status in DASHSCOPE_ERROR_STATUS:
+            if code.startswith(prefix):
+                return status
+        return HTTPStatus.BAD_REQUEST
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import timedelta
+import hashlib
+from tortoise import timezone
+from database.models import LlmCacheEntry
+from log.logger import server_logger
+
+
+# 大模型结果缓存, 以模型/应用ID、提示词版本、标题和正文的哈希为键保存在数据库中
+# 相同文章重复请求直接返回缓存结果, 不消耗token
+class LlmCache:
+    _enabled: bool = False
+    _ttl: timedelta = timedelta(days=30)
+    _max_entries: int = 200000
+
+    @classmethod
+    def init(cls, ttl_days: int = 30, max_entries: int = 200000):
+        cls._enabled = ttl_days > 0 and max_entries > 0
+        cls._ttl = timedelta(days=ttl_days)
+        cls._max_entries = max_entries
+
+    @staticmethod
+    def key(model: str, prompt_version: str, title: str, content: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, prompt_version, title, content):
+            digest.update(part.encode())
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    @classmethod
+    async def get(cls, key: str) -> str | None:
+        if not cls._enabled:
+            return None
+        try:
+            entry = await LlmCacheEntry.get_or_none(key=key, expires_at__gt=timezone.now()).only("value")
+            return entry.value if entry else None
+        except Exception as e:
+            server_logger.error(f"Get llm cache error: {e}")
+            return None
+
+    @classmethod
+    async def set(cls, key: str, value: str):
+        if not cls._enabled:
+            return
+        try:
+            await LlmCacheEntry.update_or_create(key=key, defaults={"value": value, "expires_at": timezone.now() + cls._ttl})
+        except Exception as e:
+            server_logger.error(f"Set llm cache error: {e}")
+
+    # 删除过期缓存, 超过最大条数时删除最早过期的缓存
+    @classmethod
+    async def evict(cls):
+        expired = await LlmCacheEntry.filter(expires_at__lte=timezone.now()).delete()
+        overflow = await LlmCacheEntry.all().count() - cls._max_entries
+        if overflow > 0:
+            keys = await LlmCacheEntry.all().order_by("expires_at").limit(overflow).values_list("key", flat=True)
+            await LlmCacheEntry.filter(key__in=keys).delete()
+        if expired or overflow > 0:
+            server_logger.info(f"Llm cache evicted, expired: {expired}, overflow: {max(overflow, 0)}")
+
+    @classmethod
+    async def run_eviction(cls, interval: int = 3600):
+        while cls._enabled:
+            try:
+                await cls.evict()
+            except Exception as e:
+                server_logger.error(f"Evict llm cache error: {e}")
+            await asyncio.sleep(interval)
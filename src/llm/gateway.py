@@ -0,0 +1,187 @@
+import asyncio
+from http import HTTPStatus
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+from log.logger import server_logger
+from util.ratelimit import TokenBucket
+
+T = TypeVar("T")
+
+# 流式输出结束标记
+_STREAM_END = object()
+
+
+# 大模型服务不可用(重试耗尽或熔断), 调用方应稍后重试, 不能把失败信息作为最终结果保存
+class LlmUnavailableError(Exception):
+    pass
+
+
+# 流式调用返回的错误响应
+class LlmStatusError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+# 熔断器, 连续失败达到阈值后熔断, 冷却时间后放行一次试探请求
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.failures < self.failure_threshold:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    # 试探请求被取消时没有结果, 释放试探名额, 冷却时间已过, 下一个请求可以继续试探
+    def release_probe(self):
+        self.probing = False
+
+
+# 大模型调用网关, 限制全局并发数和每分钟token数, 限流和服务端错误时抖动退避重试, 持续失败时熔断
+# 流式调用使用单独的并发名额, 接口请求不会占满入库摘要的并发名额
+class LlmGateway:
+    _semaphore: asyncio.Semaphore = asyncio.Semaphore(8)
+    _stream_semaphore: asyncio.Semaphore = asyncio.Semaphore(4)
+    _tokens: TokenBucket = TokenBucket(rate=1000000 / 60, capacity=1000000)
+    _breaker: CircuitBreaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    _max_retries: int = 3
+    _retry_base_delay: float = 1
+
+    @classmethod
+    def init(cls, max_concurrency: int = 8, tokens_per_minute: int = 1000000, max_retries: int = 3, retry_base_delay: float = 1, breaker_threshold: int = 5, breaker_reset_timeout: float = 60, max_streams: int = 4):
+        cls._semaphore = asyncio.Semaphore(max_concurrency)
+        cls._stream_semaphore = asyncio.Semaphore(max_streams)
+        cls._tokens = TokenBucket(rate=tokens_per_minute / 60, capacity=tokens_per_minute)
+        cls._breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        cls._max_retries = max_retries
+        cls._retry_base_delay = retry_base_delay
+
+    # 调用大模型, request每次重试都会重新执行, 返回dashscope响应
+    # 限流(429)、服务端错误(5xx)和网络异常会重试, 其他错误响应直接返回由调用方处理
+    @classmethod
+    async def call(cls, request: Callable[[], Awaitable[T]], tokens: int) -> T:
+        for attempt in range(cls._max_retries + 1):
+            if not cls._breaker.allow():
+                raise LlmUnavailableError("大模型服务熔断中")
+
+            try:
+                await cls._tokens.acquire(tokens)
+                async with cls._semaphore:
+                    response = await request()
+                status_code = _status_code(response)
+                error = None if status_code == HTTPStatus.OK or not _retryable(status_code) else f"{status_code} {getattr(response, 'message', '')}"
+            except Exception as e:
+                response = None
+                error = str(e)
+            except BaseException:
+                # 调用被取消
+                cls._breaker.release_probe()
+                raise
+
+            if error is None:
+                cls._breaker.record_success()
+                return response
+
+            cls._breaker.record_failure()
+            if attempt < cls._max_retries:
+                # 指数退避加随机抖动, 避免同时重试
+                delay = cls._retry_base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                server_logger.info(f"Llm call failed: {error}, retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                server_logger.error(f"Llm call failed after {cls._max_retries} retries: {error}")
+
+        raise LlmUnavailableError(f"大模型调用失败: {error}")
+
+
+    # 流式调用大模型, 逐段返回增量文本
+    # 模型输出由后台任务读入缓冲区, 生成结束即释放并发名额, 不受客户端读取速度影响; 客户端断开时取消生成
+    # 只在返回第一段文本之前重试, 已开始输出后失败抛出LlmUnavailableError
+    @classmethod
+    async def stream(cls, request: Callable[[], AsyncIterator[str]], tokens: int) -> AsyncIterator[str]:
+        for attempt in range(cls._max_retries + 1):
+            if not cls._breaker.allow():
+                raise LlmUnavailableError("大模型服务熔断中")
+
+            started = False
+            producer = None
+            try:
+                await cls._tokens.acquire(tokens)
+                # 缓冲区大小受模型最大输出长度限制
+                buffer: asyncio.Queue = asyncio.Queue()
+                producer = asyncio.create_task(cls._read_stream(request, buffer))
+                while (item := await buffer.get()) is not _STREAM_END:
+                    if isinstance(item, Exception):
+                        raise item
+                    started = True
+                    yield item
+                cls._breaker.record_success()
+                return
+            except LlmStatusError as e:
+                if not _retryable(e.status_code):
+                    cls._breaker.record_success()
+                    raise
+                error = str(e)
+            except Exception as e:
+                error = str(e)
+            except BaseException:
+                # 客户端断开或任务取消, 已有输出说明服务正常, 否则只释放试探名额
+                if started:
+                    cls._breaker.record_success()
+                else:
+                    cls._breaker.release_probe()
+                raise
+            finally:
+                if producer is not None:
+                    producer.cancel()
+
+            cls._breaker.record_failure()
+            if started:
+                raise LlmUnavailableError(f"大模型输出中断: {error}")
+            if attempt < cls._max_retries:
+                delay = cls._retry_base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                server_logger.info(f"Llm stream failed: {error}, retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                server_logger.error(f"Llm stream failed after {cls._max_retries} retries: {error}")
+
+        raise LlmUnavailableError(f"大模型调用失败: {error}")
+
+    # 在并发名额内读取模型输出到缓冲区, 以结束标记或异常结束
+    @classmethod
+    async def _read_stream(cls, request: Callable[[], AsyncIterator[str]], buffer: asyncio.Queue):
+        try:
+            async with cls._stream_semaphore:
+                async for text in request():
+                    buffer.put_nowait(text)
+            buffer.put_nowait(_STREAM_END)
+        except Exception as e:
+            buffer.put_nowait(e)
+
+
+def _status_code(response: Any) -> int:
+    return getattr(response, "status_code", HTTPStatus.OK)
+
+
+def _retryable(status_code: int) -> bool:
+    return status_code == HTTPStatus.TOO_MANY_REQUESTS or status_code >= 500
@@ -0,0 +1,85 @@
+import re
+
+# 页面正文中常见的模板内容, 只删除整行就是这些内容的行, 避免误删正文
+BOILERPLATE_LINE_PATTERN = re.compile(
+    r"(分享到|扫一扫|打印本页|关闭窗口|收藏本页|返回顶部|网站地图|联系我们|【?字体[:：]?\s*大\s*中\s*小】?)[:：]?",
+    re.IGNORECASE,
+)
+INLINE_SPACE_PATTERN = re.compile(r"[ \t　\xa0]+")
+
+
+# 粗略估算文本的token数, 中文等非ASCII字符约1个token, ASCII字符约4个1个token
+def estimate_tokens(text: str) -> int:
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return _tokens(len(text) - ascii_chars, ascii_chars)
+
+
+def _tokens(non_ascii_chars: int, ascii_chars: int) -> int:
+    return non_ascii_chars + (ascii_chars + 3) // 4
+
+
+# 清理正文, 合并连续空白, 删除空行、连续重复的行和模板内容行
+def normalize_text(text: str) -> str:
+    lines = []
+    for line in text.splitlines():
+        line = INLINE_SPACE_PATTERN.sub(" ", line).strip()
+        if not line or BOILERPLATE_LINE_PATTERN.fullmatch(line):
+            continue
+        if lines and lines[-1] == line:
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# 截取不超过token预算的前缀
+def trim_to_tokens(text: str, budget: int) -> str:
+    return _prefix(text, budget, 0, 0)
+
+
+# 截取前缀, 与已有的字符数合计不超过token预算, 与estimate_tokens计算方式一致
+def _prefix(text: str, budget: int, non_ascii_chars: int, ascii_chars: int) -> str:
+    for index, char in enumerate(text):
+        if char.isascii():
+            ascii_chars += 1
+        else:
+            non_ascii_chars += 1
+        if _tokens(non_ascii_chars, ascii_chars) > budget:
+            return text[:index]
+    return text
+
+
+# 按段落切分为不超过token预算的片段, 超长段落截断后拆分到多个片段, 段落之间的换行符也计入token
+def split_chunks(text: str, budget: int) -> list[str]:
+    if budget < 1:
+        raise ValueError(f"chunk token budget must be at least 1: {budget}")
+
+    chunks = []
+    current: list[str] = []
+    non_ascii_chars = 0
+    ascii_chars = 0
+    for paragraph in text.split("\n"):
+        while paragraph:
+            separator = 1 if current else 0
+            paragraph_ascii_chars = sum(1 for char in paragraph if char.isascii())
+            paragraph_non_ascii_chars = len(paragraph) - paragraph_ascii_chars
+            if _tokens(non_ascii_chars + paragraph_non_ascii_chars, ascii_chars + separator + paragraph_ascii_chars) <= budget:
+                current.append(paragraph)
+                non_ascii_chars += paragraph_non_ascii_chars
+                ascii_chars += separator + paragraph_ascii_chars
+                break
+
+            # 段落放不进当前片段时, 能完整放入新片段的段落不拆分
+            if not current or _tokens(paragraph_non_ascii_chars, paragraph_ascii_chars) > budget:
+                head = _prefix(paragraph, budget, non_ascii_chars, ascii_chars + separator)
+                if head:
+                    current.append(head)
+                paragraph = paragraph[len(head):]
+
+            chunks.append("\n".join(current))
+            current = []
+            non_ascii_chars = 0
+            ascii_chars = 0
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
@@ -0,0 +1,168 @@
+import argparse
+from tortoise import connections, run_async
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from database.connection import init_db
+from database.models import Page, Site
+from log.logger import db_logger
+from settings import Settings
+from util.page import get_signature
+from util.url import canonicalize_url
+
+# 32位十六进制md5签名转换为有符号64位整数, 与util.page.get_signature一致
+HEX_TO_BIGINT = "('x' || substr({column}, 1, 16))::bit(64)::bigint"
+
+
+# 查询字段类型, 字段不存在时返回空字符串
+async def column_type(conn: BaseDBAsyncClient, table: str, column: str) -> str:
+    _, rows = await conn.execute_query(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = $1 AND column_name = $2",
+        [table, column],
+    )
+    return rows[0]["data_type"] if rows else ""
+
+
+# 表是否存在, 新增的表由server启动时创建, 创建前无需迁移
+async def table_exists(conn: BaseDBAsyncClient, table: str) -> bool:
+    _, rows = await conn.execute_query("SELECT to_regclass($1) IS NOT NULL AS exists", [table])
+    return rows[0]["exists"]
+
+
+# 将签名字段从varchar(32)迁移为bigint: 新增字段 -> 分批回填 -> 建索引 -> 替换旧字段
+# 执行前需停止server, 避免迁移期间写入旧格式签名
+async def migrate_signature_column(conn: BaseDBAsyncClient, table: str, unique: bool, batch_size: int):
+    data_type = await column_type(conn, table, "signature")
+    if data_type == "bigint":
+        db_logger.info(f"{table}.signature is already bigint, skip")
+        return
+    if data_type == "":
+        db_logger.info(f"{table}.signature does not exist, skip")
+        return
+
+    await conn.execute_script(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS signature_v2 BIGINT")
+
+    # 分批回填, 避免长事务锁表
+    total = 0
+    while True:
+        count, _ = await conn.execute_query(
+            f"UPDATE {table} SET signature_v2 = {HEX_TO_BIGINT.format(column='signature')} "
+            f"WHERE id IN (SELECT id FROM {table} WHERE signature_v2 IS NULL LIMIT {batch_size})"
+        )
+        total += count
+        db_logger.info(f"{table} backfilled: {total}")
+        if count == 0:
+            break
+
+    if unique:
+        _, duplicates = await conn.execute_query(
+            f"SELECT signature_v2, count(*) AS count FROM {table} GROUP BY signature_v2 HAVING count(*) > 1 LIMIT 10"
+        )
+        if duplicates:
+            raise Exception(f"{table} has duplicated 64-bit signatures, resolve them before migrating: {[dict(row) for row in duplicates]}")
+
+    index_type = "UNIQUE INDEX" if unique else "INDEX"
+    await conn.execute_script(f"CREATE {index_type} CONCURRENTLY IF NOT EXISTS {table}_signature_v2_idx ON {table} (signature_v2)")
+
+    # 替换旧字段
+    await conn.execute_script(f"""
+        BEGIN;
+        LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE;
+        UPDATE {table} SET signature_v2 = {HEX_TO_BIGINT.format(column='signature')} WHERE signature_v2 IS NULL;
+        ALTER TABLE {table} DROP COLUMN signature;
+        ALTER TABLE {table} RENAME COLUMN signature_v2 TO signature;
+        ALTER TABLE {table} ALTER COLUMN signature SET NOT NULL;
+        ALTER INDEX {table}_signature_v2_idx RENAME TO {table}_signature_idx;
+        COMMIT;
+    """)
+    db_logger.info(f"{table}.signature migrated to bigint")
+
+
+async def migrate_signature_bigint(conn: BaseDBAsyncClient, args: argparse.Namespace):
+    await migrate_signature_column(conn, "page_signatures", unique=True, batch_size=args.batch_size)
+    await migrate_signature_column(conn, "web_search_news", unique=False, batch_size=args.batch_size)
+
+
+# 站点新增url规范化参数字段
+async def migrate_site_url_strip_params(conn: BaseDBAsyncClient, args: argparse.Namespace):
+    await conn.execute_script("ALTER TABLE sites ADD COLUMN IF NOT EXISTS url_strip_params JSONB NOT NULL DEFAULT '[]'::jsonb")
+    db_logger.info("sites.url_strip_params added")
+
+
+# 为已保存的页面补充规范化url的签名, 避免启用url规范化后旧页面被当作新页面重新抓取和推送
+async def migrate_canonical_signatures(conn: BaseDBAsyncClient, args: argparse.Namespace):
+    strip_params = {site_id: params for site_id, params in await Site.all().values_list("id", "url_strip_params")}
+
+    last_id = 0
+    total = 0
+    while True:
+        pages = await Page.filter(id__gt=last_id).order_by("id").limit(args.batch_size).values("id", "site_id", "url")
+        if not pages:
+            break
+        last_id = pages[-1]["id"]
+
+        signatures = list({get_signature(canonicalize_url(page["url"], strip_params.get(page["site_id"], []))) for page in pages})
+        count, _ = await conn.execute_query(
+            "INSERT INTO page_signatures (signature) SELECT unnest($1::bigint[]) ON CONFLICT (signature) DO NOTHING RETURNING id",
+            [signatures],
+        )
+        total += count
+        db_logger.info(f"Canonical signatures inserted: {total}, last page id: {last_id}")
+
+
+# 推送订阅新增推送时段字段, 代替原先写死的特定用户工作日9-18时推送规则
+# 推送发件箱新增汇总消息字段
+async def migrate_push_delivery_window(conn: BaseDBAsyncClient, args: argparse.Namespace):
+    await conn.execute_script("""
+        ALTER TABLE push_subscriptions ADD COLUMN IF NOT EXISTS push_weekdays JSONB NOT NULL DEFAULT '[0, 1, 2, 3, 4, 5, 6]'::jsonb;
+        ALTER TABLE push_subscriptions ADD COLUMN IF NOT EXISTS push_start_hour INT NOT NULL DEFAULT 0;
+        ALTER TABLE push_subscriptions ADD COLUMN IF NOT EXISTS push_end_hour INT NOT NULL DEFAULT 24;
+    """)
+    if await table_exists(conn, "push_outbox"):
+        await conn.execute_script("ALTER TABLE push_outbox ADD COLUMN IF NOT EXISTS digest BOOL NOT NULL DEFAULT FALSE")
+    else:
+        db_logger.info("push_outbox does not exist, skip")
+    count, _ = await conn.execute_query(
+        "UPDATE push_subscriptions SET push_weekdays = '[0, 1, 2, 3, 4]'::jsonb, push_start_hour = 9, push_end_hour = 19 WHERE staff_number = ANY($1::varchar[])",
+        [["348170", "355211", "112293", "163986"]],
+    )
+    db_logger.info(f"push delivery window added, subscriptions updated: {count}")
+
+
+# 列表页缓存状态新增解析配置md5字段, 已有状态的字段为空, 下次调度时重新抓取列表页
+async def migrate_site_list_state_rule_hash(conn: BaseDBAsyncClient, args: argparse.Namespace):
+    if not await table_exists(conn, "site_list_states"):
+        db_logger.info("site_list_states does not exist, skip")
+        return
+    await conn.execute_script("ALTER TABLE site_list_states ADD COLUMN IF NOT EXISTS rule_hash VARCHAR(32) NOT NULL DEFAULT ''")
+    db_logger.info("site_list_states.rule_hash added")
+
+
+# 推送发件箱新增已送达用户字段, 部分用户送达后重试时仍能判断页面已推送的用户
+async def migrate_push_outbox_delivered_users(conn: BaseDBAsyncClient, args: argparse.Namespace):
+    if not await table_exists(conn, "push_outbox"):
+        db_logger.info("push_outbox does not exist, skip")
+        return
+    await conn.execute_script("ALTER TABLE push_outbox ADD COLUMN IF NOT EXISTS delivered_user_ids JSONB NOT NULL DEFAULT '[]'::jsonb")
+    db_logger.info("push_outbox.delivered_user_ids added")
+
+
+MIGRATIONS = {
+    "signature_bigint": migrate_signature_bigint,
+    "site_url_strip_params": migrate_site_url_strip_params,
+    "canonical_signatures": migrate_canonical_signatures,
+    "push_delivery_window": migrate_push_delivery_window,
+    "site_list_state_rule_hash": migrate_site_list_state_rule_hash,
+    "push_outbox_delivered_users": migrate_push_outbox_delivered_users,
+}
+
+
+async def main(args: argparse.Namespace):
+    await init_db(settings=Settings())
+    await MIGRATIONS[args.name](connections.get("default"), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    parser.add_argument("name", choices=MIGRATIONS.keys(), help="迁移名称")
+    parser.add_argument("--batch-size", type=int, default=50000, help="批次大小")
+    run_async(main(parser.parse_args()))
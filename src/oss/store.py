@@ -12,11 +12,13 @@ class OSS:
         cls.bucket = oss2.Bucket(auth=auth, endpoint=endpoint, bucket_name=bucket, region=region)
 
     @classmethod
-    async def upload(cls, key: str, content: str):
+    async def upload(cls, key: str, content: str | bytes) -> bool:
         try:
             await asyncio.to_thread(cls.bucket.put_object, key, content)
+            return True
         except oss2.exceptions.OssError as e:
             server_logger.error(f"OSS Upload failed, key: {key}, error: {e}")
+            return False
 
     @classmethod
     async def delete(cls, key: str):
@@ -0,0 +1,83 @@
+import asyncio
+from dataclasses import dataclass, field
+import gzip
+import hashlib
+import json
+from tortoise import connections, timezone
+from database.models import OssObject
+from log.logger import server_logger
+from oss.store import OSS
+
+UPSERT_OSS_OBJECTS_SQL = """
+INSERT INTO oss_objects (key, sha256, updated_at)
+SELECT key, sha256, $3::timestamptz FROM unnest($1::text[], $2::text[]) AS t(key, sha256)
+ON CONFLICT (key) DO UPDATE SET sha256 = EXCLUDED.sha256, updated_at = EXCLUDED.updated_at
+"""
+
+
+@dataclass
+class SyncObject:
+    key: str
+    content: str | bytes
+
+
+@dataclass
+class SyncResult:
+    uploaded: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+
+
+# 多条记录合并为一个gzip压缩的JSONL文件, 固定mtime保证内容不变时压缩结果不变
+def jsonl_bundle(records: list[dict]) -> bytes:
+    lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    return gzip.compress(lines.encode("utf-8"), mtime=0)
+
+
+def content_hash(content: str | bytes) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+# OSS增量同步, 清单表记录每个对象上次上传内容的sha256, 内容未变化的对象跳过, 其余对象限制并发上传
+class OssSync:
+    _concurrency: int = 8
+
+    @classmethod
+    def init(cls, concurrency: int = 8):
+        cls._concurrency = max(1, concurrency)
+
+    @classmethod
+    async def sync(cls, objects: list[SyncObject]) -> SyncResult:
+        hashes = {obj.key: content_hash(obj.content) for obj in objects}
+        manifest = dict(await OssObject.filter(key__in=list(hashes)).values_list("key", "sha256"))
+
+        result = SyncResult()
+        changed = []
+        for obj in objects:
+            if manifest.get(obj.key) == hashes[obj.key]:
+                result.skipped.append(obj.key)
+            else:
+                changed.append(obj)
+
+        semaphore = asyncio.Semaphore(cls._concurrency)
+
+        async def upload(obj: SyncObject) -> bool:
+            async with semaphore:
+                return await OSS.upload(obj.key, obj.content)
+
+        uploaded = await asyncio.gather(*(upload(obj) for obj in changed))
+        for obj, ok in zip(changed, uploaded):
+            (result.uploaded if ok else result.failed).append(obj.key)
+
+        # 只记录上传成功的对象, 失败的对象下次同步时重新上传
+        if result.uploaded:
+            await connections.get("default").execute_query(UPSERT_OSS_OBJECTS_SQL, [
+                result.uploaded,
+                [hashes[key] for key in result.uploaded],
+                timezone.now(),
+            ])
+
+        server_logger.info(f"OSS sync uploaded: {len(result.uploaded)}, skipped: {len(result.skipped)}, failed: {len(result.failed)}")
+        return result
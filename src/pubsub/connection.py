@@ -5,6 +5,9 @@ from settings import Settings
 QUEUE_CRAWL_LISTPAGE = "crawl.listpage" # 列表页队列
 QUEUE_CRAWL_DETAILPAGE = "crawl.detailpage" # 详情页队列
 QUEUE_CRAWL_PAGECONTENT = "crawl.pagecontent" # 页面内容队列(爬取完成)
+QUEUE_CRAWL_LISTSTATE = "crawl.liststate" # 列表页缓存状态队列
+SUBJECT_CONFIG_INVALIDATE = "config.invalidate" # 站点配置失效通知(广播)
+CONFIG_DOMAIN_BLACKLIST = b"domain_blacklist" # 失效通知内容, 域名黑名单变化, 其他内容为站点和订阅配置变化
 
 class MsgQueue:
     @classmethod
@@ -15,6 +15,18 @@ class CrawlListPageMsg(Msg):
     rule: list[str]
     paywall: bool
     first_crawl: bool
+    etag: str = ""
+    last_modified: str = ""
+    links_hash: str = ""
+    url_strip_params: list[str] = []
+    rule_hash: str = ""
+
+class CrawlListStateMsg(Msg):
+    site_id: int
+    etag: str
+    last_modified: str
+    links_hash: str
+    rule_hash: str = ""
 
 class CrawlDetailPageMsg(Msg):
     site_id: int
@@ -25,6 +37,7 @@ class CrawlDetailPageMsg(Msg):
     crawl_detail_type: CrawlType
     first_crawl: bool
     paywall: bool
+    canonical_url: str = ""
 
 class CrawlPageContentMsg(Msg):
     site_id: int
@@ -35,4 +48,5 @@ class CrawlPageContentMsg(Msg):
     date: str
     content: str
     paywall: bool
-    first_crawl: bool
\ No newline at end of file
+    first_crawl: bool
+    canonical_url: str = ""
\ No newline at end of file
@@ -0,0 +1,56 @@
+import asyncio
+import random
+from dingtalk.client import DingTalkClient
+from log.logger import server_logger
+from util.ratelimit import TokenBucket
+
+# 钉钉批量发送单聊消息接口单次最多20个用户
+MAX_BATCH_SIZE = 20
+
+
+# 推送分发器, 同一条消息的接收用户按批合并发送, 各批次在限速下并发发送
+# 调用失败和被限流的用户退避后重试, 无效用户记录日志后跳过
+class PushDispatcher:
+    _bucket: TokenBucket = TokenBucket(rate=10, capacity=10)
+    _batch_size: int = MAX_BATCH_SIZE
+    _max_retries: int = 3
+    _retry_base_delay: float = 1
+
+    @classmethod
+    def init(cls, rate: float = 10, batch_size: int = MAX_BATCH_SIZE, max_retries: int = 3, retry_base_delay: float = 1):
+        cls._bucket = TokenBucket(rate=rate, capacity=rate)
+        cls._batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        cls._max_retries = max_retries
+        cls._retry_base_delay = retry_base_delay
+
+    # 发送消息, 返回最终未送达的用户
+    @classmethod
+    async def send(cls, user_ids: list[str], title: str, summary: str, url: str, source: str = "") -> list[str]:
+        user_ids = list(dict.fromkeys(user_ids))
+        batches = [user_ids[i:i + cls._batch_size] for i in range(0, len(user_ids), cls._batch_size)]
+        results = await asyncio.gather(*(cls._send_batch(batch, title, summary, url, source) for batch in batches))
+        return [user_id for failed in results for user_id in failed]
+
+    @classmethod
+    async def _send_batch(cls, user_ids: list[str], title: str, summary: str, url: str, source: str) -> list[str]:
+        for attempt in range(cls._max_retries + 1):
+            if attempt:
+                await asyncio.sleep(cls._retry_base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            await cls._bucket.acquire()
+            try:
+                result = await DingTalkClient.send_batch_message(user_ids, title, summary, url, source)
+            except Exception as e:
+                server_logger.error(f"Push batch failed, users: {len(user_ids)}, attempt: {attempt + 1}, {e}")
+                continue
+
+            if result.invalid_user_ids:
+                server_logger.error(f"Push invalid users: {result.invalid_user_ids}: {title}")
+            # 只重试被限流的用户
+            user_ids = result.flow_controlled_user_ids
+            if not user_ids:
+                return []
+            server_logger.info(f"Push flow controlled users: {user_ids}, attempt: {attempt + 1}")
+
+        server_logger.error(f"Push failed users: {user_ids}: {title}")
+        return user_ids
@@ -0,0 +1,193 @@
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+import json
+from tortoise import connections, timezone
+from database.models import PushOutbox, PushStatus
+from log.logger import server_logger
+from push.dispatcher import PushDispatcher
+
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+# 领取待推送的消息, 同时推迟下次领取时间作为租约, 发送中断的消息在租约过期后可被重新领取
+# 多个服务实例同时运行时, 跳过已被其他实例锁定的消息
+CLAIM_PUSH_OUTBOX_SQL = """
+UPDATE push_outbox SET next_attempt_at = $2, attempts = attempts + 1
+WHERE id IN (
+    SELECT id FROM push_outbox
+    WHERE status = 'pending' AND NOT digest AND next_attempt_at <= $1
+    ORDER BY next_attempt_at
+    LIMIT $3
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, user_ids, delivered_user_ids, title, summary, url, source, attempts
+"""
+
+# 领取已到推送时段的汇总消息, 每条只有一个用户
+CLAIM_PUSH_DIGEST_SQL = """
+UPDATE push_outbox SET next_attempt_at = $2, attempts = attempts + 1
+WHERE id IN (
+    SELECT id FROM push_outbox
+    WHERE status = 'pending' AND digest AND next_attempt_at <= $1
+    ORDER BY next_attempt_at
+    LIMIT $3
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, user_ids, title, url, source, attempts, created_at
+"""
+
+# 单条汇总消息最多包含的内容条数
+DIGEST_MAX_ITEMS = 30
+
+
+# 已推送或待推送过某页面的用户, 部分送达的消息计入已送达的用户, 推送失败的用户不计入
+async def pushed_user_ids(page_id: int) -> set[str]:
+    rows = await PushOutbox.filter(page_id=page_id).values_list("status", "user_ids", "delivered_user_ids")
+    pushed = set()
+    for status, user_ids, delivered_user_ids in rows:
+        pushed.update(_json_list(delivered_user_ids))
+        if status in (PushStatus.PENDING, PushStatus.DELIVERED):
+            pushed.update(_json_list(user_ids))
+    return pushed
+
+
+def _json_list(value) -> list:
+    return json.loads(value) if isinstance(value, str) else value
+
+
+# 推送发件箱分发, 推送消息与页面在同一事务中写入发件箱, 由后台任务批量领取发送
+# 不在推送时段内的用户按用户写入汇总消息, 推送时段开始后每个用户合并为一条消息发送
+# 发送失败的用户退避后重试, 超过最大次数标记为失败
+class OutboxDispatcher:
+    _wakeup: asyncio.Event = asyncio.Event()
+    _batch_size: int = 50
+    _digest_batch_size: int = 500
+    _max_attempts: int = 5
+    _lease: timedelta = timedelta(minutes=5)
+    _retry_delay: timedelta = timedelta(seconds=30)
+
+    @classmethod
+    async def run(cls, interval: int = 10, batch_size: int = 50, max_attempts: int = 5, retry_delay: int = 30, digest_batch_size: int = 500):
+        cls._wakeup = asyncio.Event()
+        cls._batch_size = batch_size
+        cls._digest_batch_size = digest_batch_size
+        cls._max_attempts = max_attempts
+        cls._retry_delay = timedelta(seconds=retry_delay)
+        while True:
+            claimed = 0
+            try:
+                claimed = await cls.dispatch_pending()
+            except Exception as e:
+                server_logger.error(f"Dispatch push outbox error: {e}")
+
+            try:
+                await cls.dispatch_digests()
+            except Exception as e:
+                server_logger.error(f"Dispatch push digest error: {e}")
+
+            # 领取满一批说明还有积压, 立即继续, 否则等待新消息通知或轮询间隔
+            if claimed < cls._batch_size:
+                try:
+                    await asyncio.wait_for(cls._wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                cls._wakeup.clear()
+
+    # 新消息写入发件箱后调用, 唤醒本实例的分发任务
+    @classmethod
+    def notify(cls):
+        cls._wakeup.set()
+
+    # 删除超过保留天数的已送达和失败消息, 保留天数不应小于近似重复检测的索引天数, 以便判断原页面已推送的用户
+    @classmethod
+    async def evict(cls, retention_days: int = 30):
+        deleted = await PushOutbox.filter(
+            status__in=[PushStatus.DELIVERED, PushStatus.FAILED],
+            created_at__lte=timezone.now() - timedelta(days=retention_days),
+        ).delete()
+        if deleted:
+            server_logger.info(f"Push outbox evicted: {deleted}")
+
+    @classmethod
+    async def run_eviction(cls, retention_days: int = 30, interval: int = 3600):
+        while True:
+            try:
+                await cls.evict(retention_days)
+            except Exception as e:
+                server_logger.error(f"Evict push outbox error: {e}")
+            await asyncio.sleep(interval)
+
+    @classmethod
+    async def dispatch_pending(cls) -> int:
+        now = timezone.now()
+        _, rows = await connections.get("default").execute_query(CLAIM_PUSH_OUTBOX_SQL, [now, now + cls._lease, cls._batch_size])
+        await asyncio.gather(*(cls._dispatch(row) for row in rows))
+        return len(rows)
+
+    @classmethod
+    async def _dispatch(cls, row):
+        user_ids = _json_list(row["user_ids"])
+
+        try:
+            failed_user_ids = await PushDispatcher.send(user_ids, row["title"], row["summary"], row["url"], row["source"])
+            error = f"failed users: {failed_user_ids}" if failed_user_ids else ""
+        except Exception as e:
+            failed_user_ids = user_ids
+            error = str(e)
+
+        # 本次送达的用户追加到已送达列表, user_ids只保留未送达的用户
+        delivered_user_ids = _json_list(row["delivered_user_ids"]) + [user_id for user_id in user_ids if user_id not in failed_user_ids]
+        if not failed_user_ids:
+            await PushOutbox.filter(id=row["id"]).update(status=PushStatus.DELIVERED, delivered_user_ids=delivered_user_ids, delivered_at=timezone.now())
+            server_logger.info(f"Push message to {len(user_ids)} users: {row['title']}")
+        elif row["attempts"] >= cls._max_attempts:
+            await PushOutbox.filter(id=row["id"]).update(status=PushStatus.FAILED, user_ids=failed_user_ids, delivered_user_ids=delivered_user_ids, last_error=error)
+            server_logger.error(f"Push message failed after {row['attempts']} attempts: {row['title']} {error}")
+        else:
+            # 只重试未送达的用户
+            delay = min(MAX_RETRY_DELAY, cls._retry_delay * 2 ** (row["attempts"] - 1))
+            await PushOutbox.filter(id=row["id"]).update(user_ids=failed_user_ids, delivered_user_ids=delivered_user_ids, last_error=error, next_attempt_at=timezone.now() + delay)
+
+    @classmethod
+    async def dispatch_digests(cls) -> int:
+        now = timezone.now()
+        _, rows = await connections.get("default").execute_query(CLAIM_PUSH_DIGEST_SQL, [now, now + cls._lease, cls._digest_batch_size])
+        user_rows = defaultdict(list)
+        for row in rows:
+            user_rows[_json_list(row["user_ids"])[0]].append(row)
+        await asyncio.gather(*(cls._dispatch_digest(user_id, user_rows[user_id]) for user_id in user_rows))
+        return len(rows)
+
+    @classmethod
+    async def _dispatch_digest(cls, user_id: str, rows: list):
+        rows = sorted(rows, key=lambda row: row["created_at"])
+        failed_rows = []
+        error = ""
+        for i in range(0, len(rows), DIGEST_MAX_ITEMS):
+            batch = rows[i:i + DIGEST_MAX_ITEMS]
+            items = "\n\n".join(f"{index + 1}. [{row['title']}]({row['url']}) {row['source']}" for index, row in enumerate(batch, start=i))
+            try:
+                failed = await PushDispatcher.send([user_id], f"订阅内容汇总({len(rows)}条)", items, "", "非推送时段的订阅内容")
+                if failed:
+                    error = f"failed users: {failed}"
+            except Exception as e:
+                failed = [user_id]
+                error = str(e)
+            if failed:
+                failed_rows.extend(batch)
+            else:
+                await PushOutbox.filter(id__in=[row["id"] for row in batch]).update(status=PushStatus.DELIVERED, delivered_user_ids=[user_id], delivered_at=timezone.now())
+
+        if not failed_rows:
+            server_logger.info(f"Push digest of {len(rows)} items to user {user_id}")
+            return
+
+        retry_ids = [row["id"] for row in failed_rows if row["attempts"] < cls._max_attempts]
+        failed_ids = [row["id"] for row in failed_rows if row["attempts"] >= cls._max_attempts]
+        if retry_ids:
+            attempts = max(row["attempts"] for row in failed_rows)
+            delay = min(MAX_RETRY_DELAY, cls._retry_delay * 2 ** (attempts - 1))
+            await PushOutbox.filter(id__in=retry_ids).update(last_error=error, next_attempt_at=timezone.now() + delay)
+        if failed_ids:
+            await PushOutbox.filter(id__in=failed_ids).update(status=PushStatus.FAILED, last_error=error)
+            server_logger.error(f"Push digest failed after max attempts: user {user_id}, items: {len(failed_ids)} {error}")
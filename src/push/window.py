@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from database.models import PushSubscription
+
+ALL_WEEKDAYS = [0, 1, 2, 3, 4, 5, 6]
+
+# 推送时段按北京时间计算, 不依赖数据库连接配置的时区
+PUSH_TIMEZONE = timezone(timedelta(hours=8))
+
+
+# 推送计划, user_ids为立即推送的用户, deferred为不在推送时段内的用户及其下一个推送时段的开始时间
+@dataclass
+class PushPlan:
+    user_ids: list[str] = field(default_factory=list)
+    deferred: dict[str, datetime] = field(default_factory=dict)
+
+
+# 校验推送时段配置, 不合法时抛出ValueError
+def validate_window(weekdays: list[int], start_hour: int, end_hour: int):
+    if not weekdays or any(weekday not in ALL_WEEKDAYS for weekday in weekdays):
+        raise ValueError(f"push_weekdays必须是0-6的非空列表: {weekdays}")
+    if not 0 <= start_hour <= 23 or not 0 <= end_hour <= 24:
+        raise ValueError(f"推送时段小时超出范围: {start_hour}-{end_hour}")
+
+
+# 订阅的推送时段, 返回可推送的星期和开始、结束小时
+# 未设置有效星期时视为每天, 开始和结束小时相同时视为全天, 数据库中超出范围的小时按边界处理
+def _window(subscription: PushSubscription) -> tuple[list[int], int, int]:
+    weekdays = [weekday for weekday in subscription.push_weekdays if weekday in ALL_WEEKDAYS] or ALL_WEEKDAYS
+    start_hour = min(max(subscription.push_start_hour, 0), 23)
+    end_hour = min(max(subscription.push_end_hour, 0), 24)
+    if start_hour == end_hour:
+        return weekdays, 0, 24
+    return weekdays, start_hour, end_hour
+
+
+# 是否在订阅的推送时段内, 时段为push_weekdays中每天的[push_start_hour, push_end_hour)
+# 开始小时大于结束小时时为跨夜时段, 从push_weekdays中某天的开始小时持续到次日的结束小时
+def in_window(subscription: PushSubscription, now: datetime) -> bool:
+    weekdays, start_hour, end_hour = _window(subscription)
+    if start_hour < end_hour:
+        return now.weekday() in weekdays and start_hour <= now.hour < end_hour
+    return (now.weekday() in weekdays and now.hour >= start_hour) or ((now.weekday() - 1) % 7 in weekdays and now.hour < end_hour)
+
+
+# 下一个推送时段的开始时间
+def next_window_start(subscription: PushSubscription, now: datetime) -> datetime:
+    weekdays, start_hour, _ = _window(subscription)
+    start = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+    days = 0
+    while True:
+        candidate = start + timedelta(days=days)
+        if candidate > now and candidate.weekday() in weekdays:
+            return candidate
+        days += 1
+
+
+# 筛选推送用户, 同一用户有多个订阅时任一订阅在推送时段内即立即推送, 否则延后到最早的推送时段合并推送
+def plan_push(subscriptions: list[PushSubscription], now: datetime | None = None) -> PushPlan:
+    now = (now or datetime.now(PUSH_TIMEZONE)).astimezone(PUSH_TIMEZONE)
+
+    plan = PushPlan()
+    for subscription in subscriptions:
+        staff_number = subscription.staff_number
+        if staff_number in plan.user_ids:
+            continue
+        if in_window(subscription, now):
+            plan.user_ids.append(staff_number)
+            plan.deferred.pop(staff_number, None)
+            continue
+
+        deliver_at = next_window_start(subscription, now)
+        if staff_number not in plan.deferred or deliver_at < plan.deferred[staff_number]:
+            plan.deferred[staff_number] = deliver_at
+    return plan
@@ -3,20 +3,23 @@ import datetime as dt
 from datetime import datetime
 import urllib.parse
 from fastapi import APIRouter, Body, Depends, HTTPException, Query
-from fastapi.responses import PlainTextResponse
-import hashlib
+from fastapi.responses import PlainTextResponse, Response as BinaryResponse
 
 from pydantic import BaseModel, Field
 from crawl.api import search_web_news
-from database.models import DomainBlacklist, Page, PageSignature, Site, WebSearchNews
+from database.models import Page, PageSignature, Site, SiteListState, WebSearchNews
+from dedupe.signature import DomainBlacklistIndex, SignatureBloom, SignatureIndex
 from llm.bailian import Bailian
+from llm.gateway import LlmUnavailableError
 from log.logger import server_logger
-from oss.store import OSS
+from oss.sync import OssSync, SyncObject, jsonl_bundle
 from pubsub.connection import MsgQueue, QUEUE_CRAWL_LISTPAGE
 from pubsub.msg import CrawlListPageMsg
-from route.response import Response
+from route.response import Response, sse_response
 from settings import get_settings, Settings
-from crawl.util import duplicate_search_web_news
+from crawl.util import duplicate_search_web_news, get_rule_hash
+from ingest.pipeline import PENDING_SUMMARY
+from util.page import get_signature
 
 crawl_router = APIRouter(prefix="/crawl", tags=["爬取"])
 
@@ -62,7 +65,13 @@ async def schedule(token: str = Query(..., description="授权令牌"), settings
         pub_conn = await MsgQueue.connect(settings)
 
         sites = await Site.all().order_by("-id")
+        list_states = {state.site_id: state for state in await SiteListState.all()}
         for site in sites:
+            # 站点列表页配置修改后不再使用修改前保存的缓存状态, 重新抓取和解析列表页
+            rule_hash = get_rule_hash(site.listpage_url, site.listpage_crawl_type, site.listpage_parse_rule, site.url_strip_params)
+            list_state = list_states.get(site.id)
+            if list_state and list_state.rule_hash != rule_hash:
+                list_state = None
             await pub_conn.publish(
                 subject=QUEUE_CRAWL_LISTPAGE,
                 payload=CrawlListPageMsg(
@@ -74,6 +83,11 @@ async def schedule(token: str = Query(..., description="授权令牌"), settings
                     rule=site.listpage_parse_rule,
                     paywall=site.paywall,
                     first_crawl=site.crawled_at is None, # 首次爬取标记, 用于判断是否需要发送推送
+                    etag=list_state.etag if list_state else "",
+                    last_modified=list_state.last_modified if list_state else "",
+                    links_hash=list_state.links_hash if list_state else "",
+                    url_strip_params=site.url_strip_params,
+                    rule_hash=rule_hash,
                 ).model_dump_json().encode("utf-8")
             )
 
@@ -92,7 +106,7 @@ async def schedule(token: str = Query(..., description="授权令牌"), settings
 
 
 @crawl_router.post("/sync_articles_to_oss", description="同步文章到OSS")
-async def sync_articles_to_oss(token: str = Query(..., description="授权令牌"), settings: Settings = Depends(get_settings)) -> Response[bool]:
+async def sync_articles_to_oss(token: str = Query(..., description="授权令牌"), bundle: bool = Query(False, description="是否合并为一个gzip压缩的JSONL文件"), settings: Settings = Depends(get_settings)) -> Response[bool]:
     if token != settings.admin_auth_token:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -103,14 +117,31 @@ async def sync_articles_to_oss(token: str = Query(..., description="授权令牌
         visible=True,
         date__gte=datetime.combine(today, datetime.min.time()),
         date__lte=datetime.combine(today, datetime.max.time())
-    ).all().select_related("site")
+    ).exclude(summary=PENDING_SUMMARY).all().select_related("site")
 
+    # 摘要待重新生成的页面不同步, 摘要生成后内容变化, 下次同步时上传
     today_str = today.strftime("%Y-%m-%d")
-    for page in pages:
-        summary_url = f"https://pre-assistant-voice-ga.alibaba-inc.com/weekly?source_link={urllib.parse.quote_plus(page.display_url)}"
-        content = f"标题: {page.title}\n\n日期: {page.date.strftime("%Y-%m-%d")}\n\n来源: {page.site.name}\n\n网址: {page.display_url}\n\n摘要: {page.summary}\n\n详细摘要地址: {summary_url}"
-        await OSS.upload(f"articles/{today_str}_{page.id}.txt", content)
-
+    if bundle:
+        # 当天所有文章合并为一个文件
+        objects = [SyncObject(f"articles/{today_str}.jsonl.gz", jsonl_bundle([{
+            "id": str(page.id),
+            "title": page.title,
+            "date": page.date.strftime("%Y-%m-%d"),
+            "source": page.site.name,
+            "url": page.display_url,
+            "summary": page.summary,
+            "summary_url": f"https://pre-assistant-voice-ga.alibaba-inc.com/weekly?source_link={urllib.parse.quote_plus(page.display_url)}",
+        } for page in pages]))]
+    else:
+        objects = []
+        for page in pages:
+            summary_url = f"https://pre-assistant-voice-ga.alibaba-inc.com/weekly?source_link={urllib.parse.quote_plus(page.display_url)}"
+            content = f"标题: {page.title}\n\n日期: {page.date.strftime("%Y-%m-%d")}\n\n来源: {page.site.name}\n\n网址: {page.display_url}\n\n摘要: {page.summary}\n\n详细摘要地址: {summary_url}"
+            objects.append(SyncObject(f"articles/{today_str}_{page.id}.txt", content))
+
+    result = await OssSync.sync(objects)
+    if result.failed:
+        return Response.fail(f"同步失败: {len(result.failed)}个文件")
     return Response.success(True)
 
 
@@ -122,7 +153,7 @@ async def get_articles(start_date: str = Query(..., description="开始日期"),
         visible=True,
         created_at__gte=datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S"),
         created_at__lte=datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-    ).order_by("-id").all().select_related("site")
+    ).exclude(summary=PENDING_SUMMARY).order_by("-id").all().select_related("site")
 
 
     china_timezone = dt.timezone(dt.timedelta(hours=8))
@@ -153,7 +184,7 @@ async def get_articles_gov(start_date: str = Query(..., description="开始日
         visible=True,
         created_at__gte=datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S"),
         created_at__lte=datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-    ).order_by("-id").all().select_related("site")
+    ).exclude(summary=PENDING_SUMMARY).order_by("-id").all().select_related("site")
 
 
     china_timezone = dt.timezone(dt.timedelta(hours=8))
@@ -182,10 +213,19 @@ class SummarizeArticleRequest(BaseModel):
 
 @crawl_router.post("/summarize_article", description="总结文章")
 async def summarize_article(summarize_request: SummarizeArticleRequest = Body(..., description="总结文章请求")) -> Response[str]:
-    result = await Bailian.text_summary(summarize_request.title, summarize_request.content)
+    try:
+        result = await Bailian.text_summary(summarize_request.title, summarize_request.content)
+    except LlmUnavailableError as e:
+        server_logger.error(f"Summarize article error: {e}")
+        return Response.fail("大模型服务繁忙，请稍后重试")
     return Response.success(result)
 
 
+@crawl_router.post("/summarize_article/stream", description="流式总结文章(SSE)")
+async def summarize_article_stream(summarize_request: SummarizeArticleRequest = Body(..., description="总结文章请求")):
+    return sse_response(Bailian.stream_summary(summarize_request.title, summarize_request.content))
+
+
 @crawl_router.get("/today_articles", description="获取今日文章", response_class=PlainTextResponse)
 async def today_articles(chunk: int = Query(1, description="分块")) -> str:
     site_ids = await Site.filter(send_to_aiagent=True).values_list("id", flat=True)
@@ -207,7 +247,7 @@ async def today_articles(chunk: int = Query(1, description="分块")) -> str:
         pages_chunk = chunks[1]
 
     for page in pages_chunk:
-        if page.summary.find("大模型生成摘要失败") != -1:
+        if page.summary.find("大模型生成摘要失败") != -1 or page.summary == PENDING_SUMMARY:
             continue
         
         summary_url = f"https://pre-assistant-voice-ga.alibaba-inc.com/weekly?source_link={urllib.parse.quote_plus(page.display_url)}"
@@ -228,22 +268,33 @@ async def trigger_agent(token: str = Query(..., description="授权令牌"), set
     return Response.success(result)
 
 
+@crawl_router.get("/signature_bloom", description="获取已爬取页面签名的布隆过滤器", response_class=BinaryResponse)
+async def signature_bloom(settings: Settings = Depends(get_settings)) -> BinaryResponse:
+    data = await SignatureBloom.get(settings.signature_bloom_error_rate, settings.signature_bloom_ttl)
+    return BinaryResponse(content=data, media_type="application/octet-stream")
+
+
 @crawl_router.post("/deduplicate", description="爬取页面去重")
 async def deduplicate(urls: list[str]) -> Response[list[str]]:
     if not urls:
         return Response.success([])
 
     # 检查urls中是否包含域名黑名单中的域名
-    domain_blacklist = await DomainBlacklist.all().values_list("domain", flat=True)
-    urls = list(filter(lambda url: not any(domain in url for domain in domain_blacklist), urls))
+    urls = [url for url in urls if not DomainBlacklistIndex.is_blocked(url)]
 
-    signature_url_map: dict[str, str] = {}
+    # 内存索引中已存在的签名直接过滤, 不存在的再查询数据库确认(可能由其他服务实例写入)
+    unknown_signature_url_map: dict[int, str] = {}
     for url in urls:
-        signature = hashlib.md5(url.encode()).hexdigest()
-        signature_url_map[signature] = url
+        signature = get_signature(url)
+        if not SignatureIndex.contains(signature):
+            unknown_signature_url_map[signature] = url
+
+    if not unknown_signature_url_map:
+        return Response.success([])
 
-    signatures = signature_url_map.keys()
-    exist_signatures = await PageSignature.filter(signature__in=signatures).values_list("signature", flat=True)
+    exist_signatures = set(await PageSignature.filter(signature__in=list(unknown_signature_url_map.keys())).values_list("signature", flat=True))
+    for signature in exist_signatures:
+        SignatureIndex.add(signature)
 
     # 返回signature不存在的url的列表
-    return Response.success([signature_url_map[signature] for signature in signatures if signature not in exist_signatures])
\ No newline at end of file
+    return Response.success([url for signature, url in unknown_signature_url_map.items() if signature not in exist_signatures])
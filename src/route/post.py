@@ -7,6 +7,8 @@ from pydantic import BaseModel, Field
 from crawl.api import ApiNews
 from database.models import Page, PageContent, Site, SiteCategory, WebSearchNews
 from llm.bailian import Bailian
+from llm.gateway import LlmUnavailableError
+from route.response import sse_response
 
 post_router = APIRouter(prefix="/post", tags=["post"])
 
@@ -93,10 +95,21 @@ async def get_article_interpretation(id: int = Path(..., description="文章ID")
     page = await Page.get(id=id)
     page_content = await PageContent.get(page_id=id)
 
-    interpretation = await Bailian.rag_interpretation(page.title, page_content.content)
+    try:
+        interpretation = await Bailian.rag_interpretation(page.title, page_content.content)
+    except LlmUnavailableError:
+        return Response(success=False, error_message="大模型服务繁忙，请稍后重试", data=None, pagination=None)
     return Response(success=True, error_message="", data=PostInterpretation(title=page.title, url=page.url, content=interpretation), pagination=None)
 
 
+@post_router.get("/{id}/interpretation/stream", summary="流式获取文章解读(SSE)")
+async def get_article_interpretation_stream(id: int = Path(..., description="文章ID")):
+    page = await Page.get(id=id)
+    page_content = await PageContent.get(page_id=id)
+
+    return sse_response(Bailian.stream_interpretation(page.title, page_content.content))
+
+
 # 获取所有站点
 async def get_sites(names: list[str] = Query(..., description="站点名称")) -> tuple[list[int], dict[int, str]]:
     sites = await Site.filter(name__in=names).all()
@@ -110,6 +123,6 @@ async def get_search_web_news(company: str = Query(..., description="公司"), l
         title=news.title,
         url=news.url,
         website="",
-        signature="",
+        signature=news.signature,
         date=news.date.strftime("%Y-%m-%d")
     ) for news in news], pagination=None)
@@ -1,5 +1,9 @@
-from typing import TypeVar, Generic, Optional
+import json
+from typing import AsyncIterator, TypeVar, Generic, Optional
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from llm.gateway import LlmUnavailableError
+from log.logger import server_logger
 
 T = TypeVar("T")
 class Response(BaseModel, Generic[T]):
@@ -13,4 +17,23 @@ class Response(BaseModel, Generic[T]):
     
     @classmethod
     def fail(cls, message: str) -> "Response[T]":
-        return cls(code=1, message=message, data=None)
\ No newline at end of file
+        return cls(code=1, message=message, data=None)
+
+
+# 以SSE格式返回大模型增量输出, 每段文本一个message事件, 结束时发送done事件, 失败时发送error事件
+def sse_response(chunks: AsyncIterator[str]) -> StreamingResponse:
+    async def events():
+        try:
+            async for text in chunks:
+                yield f"data: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except LlmUnavailableError as e:
+            server_logger.error(f"Stream llm error: {e}")
+            yield f"event: error\ndata: {json.dumps({'message': '大模型服务繁忙，请稍后重试'}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 禁止代理缓冲, 保证增量内容及时发送到客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
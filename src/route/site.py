@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel, Field
+from cache.site import SiteConfigCache
 from database.models import CrawlRequest, CrawlType, DomainBlacklist, PushSubscription, Site, SiteCategory
+from dedupe.signature import DomainBlacklistIndex
 from dingtalk.client import DingTalkClient
+from push.window import ALL_WEEKDAYS, validate_window
 from route.response import Response
 from settings import get_settings, Settings
 
@@ -21,6 +24,7 @@ class SiteItem(BaseModel):
     listpage_parse_rule: list[str] = Field(..., description="列表页解析规则")
     content_filter_keywords: str = Field(..., description="内容过滤关键词")
     paywall: bool = Field(..., description="是否付费阅读")
+    url_strip_params: list[str] = Field(..., description="url规范化时额外去除的参数")
 
 
 @site_router.get("/list", description="获取站点列表")
@@ -36,6 +40,7 @@ async def list_sites(request: SiteListRequest = Query(..., description="请求
         listpage_parse_rule=site.listpage_parse_rule,
         content_filter_keywords=site.content_filter_keywords,
         paywall=site.paywall,
+        url_strip_params=site.url_strip_params,
     ) for site in sites])
 
 
@@ -48,14 +53,23 @@ class SiteAddRequest(BaseModel):
     listpage_parse_rule: list[str] = Field(..., description="列表页解析规则")
     content_filter_keywords: str = Field(..., description="内容过滤关键词")
     paywall: bool = Field(False, description="是否付费阅读")
+    url_strip_params: list[str] = Field([], description="url规范化时额外去除的参数, 以*结尾表示前缀匹配")
     subscribe_staff_numbers: list[str] = Field([], description="订阅用户工号列表")
     subscribe_filter_keywords: str = Field("", description="订阅过滤关键词")
+    subscribe_push_weekdays: list[int] = Field(ALL_WEEKDAYS, description="订阅可推送的星期, 0为周一")
+    subscribe_push_start_hour: int = Field(0, description="订阅可推送时段开始小时")
+    subscribe_push_end_hour: int = Field(24, description="订阅可推送时段结束小时(不含), 小于开始小时表示跨夜")
 
 @site_router.post("/add", description="添加站点")
 async def add_site(request: SiteAddRequest, token: str = Query(..., description="授权令牌"), settings: Settings = Depends(get_settings)) -> Response[int]:
     if token != settings.admin_auth_token:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+    try:
+        validate_window(request.subscribe_push_weekdays, request.subscribe_push_start_hour, request.subscribe_push_end_hour)
+    except ValueError as e:
+        return Response.fail(str(e))
+
     try:
         exist_site = await Site.filter(listpage_url=request.listpage_url).first()
         if exist_site:
@@ -70,6 +84,7 @@ async def add_site(request: SiteAddRequest, token: str = Query(..., description=
             listpage_parse_rule=request.listpage_parse_rule,
             content_filter_keywords=request.content_filter_keywords,
             paywall=request.paywall,
+            url_strip_params=request.url_strip_params,
         )
 
         for staff_number in request.subscribe_staff_numbers:
@@ -77,8 +92,12 @@ async def add_site(request: SiteAddRequest, token: str = Query(..., description=
                 site_id=site.id,
                 staff_number=staff_number,
                 filter_keywords=request.subscribe_filter_keywords,
+                push_weekdays=request.subscribe_push_weekdays,
+                push_start_hour=request.subscribe_push_start_hour,
+                push_end_hour=request.subscribe_push_end_hour,
             )
 
+        await SiteConfigCache.invalidate()
         return Response.success(site.id)
     except Exception as e:
         return Response.fail(f"添加站点失败: {e}")
@@ -88,12 +107,20 @@ class SubscribeAddRequest(BaseModel):
     site_ids: list[int] = Field(..., description="站点ID列表")
     user_id: str = Field(..., description="用户ID")
     filter_keywords: str = Field("", description="过滤关键词")
+    push_weekdays: list[int] = Field(ALL_WEEKDAYS, description="可推送的星期, 0为周一")
+    push_start_hour: int = Field(0, description="可推送时段开始小时")
+    push_end_hour: int = Field(24, description="可推送时段结束小时(不含), 小于开始小时表示跨夜")
 
 @site_router.post("/subscribe/add", description="添加订阅")
 async def subscribe_site(request: SubscribeAddRequest, token: str = Query(..., description="授权令牌"), settings: Settings = Depends(get_settings)) -> Response[bool]:
     if token != settings.admin_auth_token:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    
+
+    try:
+        validate_window(request.push_weekdays, request.push_start_hour, request.push_end_hour)
+    except ValueError as e:
+        return Response.fail(str(e))
+
     if request.site_ids[0] == -1:
         site_ids = await Site.all().values_list("id", flat=True)
     else:
@@ -109,9 +136,15 @@ async def subscribe_site(request: SubscribeAddRequest, token: str = Query(..., d
                 site_id=site_id,
                 staff_number=request.user_id,
                 filter_keywords=request.filter_keywords,
+                push_weekdays=request.push_weekdays,
+                push_start_hour=request.push_start_hour,
+                push_end_hour=request.push_end_hour,
             )
         except Exception as e:
+            await SiteConfigCache.invalidate()
             return Response.fail(f"添加订阅失败: {e}")
+
+    await SiteConfigCache.invalidate()
     return Response.success(True)
 
 
@@ -129,11 +162,25 @@ async def add_domain_blacklist(request: DomainBlacklistAddRequest, token: str =
             return Response.fail("域名已存在")
 
         domain_blacklist = await DomainBlacklist.create(domain=request.domain)
+        await DomainBlacklistIndex.invalidate()
         return Response.success(domain_blacklist.id)
     except Exception as e:
         return Response.fail(f"添加域名黑名单失败: {e}")
 
 
+@site_router.post("/config/reload", description="重新加载所有服务实例的站点、订阅和域名黑名单配置")
+async def reload_config(token: str = Query(..., description="授权令牌"), settings: Settings = Depends(get_settings)) -> Response[bool]:
+    if token != settings.admin_auth_token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        await SiteConfigCache.invalidate()
+        await DomainBlacklistIndex.invalidate()
+        return Response.success(True)
+    except Exception as e:
+        return Response.fail(f"重新加载配置失败: {e}")
+
+
 @site_router.post("/conversation", description="通过对话添加站点")
 async def add_site_by_conversation(request: Request):
     try:
@@ -1,98 +1,77 @@
 import asyncio
-from datetime import datetime
 import uvicorn
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from starlette.middleware.cors import CORSMiddleware
 from nats.aio.client import Client
 from tortoise.contrib.fastapi import RegisterTortoise
+from cache.site import SiteConfigCache
 from database.connection import generate_tortoise_config
-from database.models import Page, PageContent, PageSignature, PushSubscription, Site
+from database.models import SiteListState
+from dedupe.signature import DomainBlacklistIndex, SignatureIndex
+from dedupe.simhash import NearDuplicateIndex
 from dingtalk.client import DingTalkClient
+from ingest.pipeline import IngestPipeline
+from ingest.summary import SummaryRetryWorker
+from ingest.writer import PageWriter
 from llm.bailian import Bailian
+from llm.cache import LlmCache
+from llm.gateway import LlmGateway
 from log.logger import server_logger
 from oss.store import OSS
-from pubsub.msg import CrawlPageContentMsg
+from oss.sync import OssSync
+from pubsub.msg import CrawlListStateMsg
 from route.crawl import crawl_router
 from route.post import post_router
 from route.site import site_router
 from settings import get_settings
 from middleware.log import AccessLogMiddleware
-from pubsub.connection import QUEUE_CRAWL_PAGECONTENT, MsgQueue
+from pubsub.connection import QUEUE_CRAWL_LISTSTATE, MsgQueue
+from push.dispatcher import PushDispatcher
+from push.outbox import OutboxDispatcher
 from util.http import HttpClient
-from util.page import get_signature, is_hit_keywords
 
 app_settings = get_settings()
 
-async def subscribe_and_save_crawl_page_content_and_push(sub_conn: Client):
-    sub = await sub_conn.subscribe(QUEUE_CRAWL_PAGECONTENT, queue="workers")
+async def subscribe_and_save_crawl_list_state(sub_conn: Client):
+    sub = await sub_conn.subscribe(QUEUE_CRAWL_LISTSTATE, queue="workers")
     async for msg in sub.messages:
         try:
-            page_content = CrawlPageContentMsg.model_validate_json(msg.data.decode("utf-8"))
-
-            # 无条件记录页面签名，用于去重
-            page_signature = await PageSignature.create(signature=get_signature(page_content.url))
-
-            # 根据站点id获取过滤关键词
-            site_id = page_content.site_id
-            site = await Site.get(id=site_id).only("content_filter_keywords")
-
-            # 如果命中过滤关键词才进行保存
-            if is_hit_keywords(page_content.title, page_content.content, site.content_filter_keywords):
-                if page_content.paywall:
-                    summary = "网站包含付费订阅内容，请查看原文"
-                else:
-                    summary = await Bailian.text_summary(page_content.title, page_content.content)
-                page = await Page.create(
-                    site_id=site_id,
-                    title=page_content.title,
-                    url=page_content.url,
-                    display_url=page_content.display_url if page_content.display_url != "" else page_content.url,
-                    summary=summary,
-                    date=page_content.date,
-                    signature_id=page_signature.id,
-                    visible=True
-                )
-
-                await PageContent.create(
-                    page_id=page.id,
-                    content=page_content.content
-                )
-
-                # 首次爬取数据量大, 不进行推送
-                if page_content.first_crawl:
-                    continue
-
-                # 非首次爬取, 根据推送过滤关键词进行推送
-                sub_users = await PushSubscription.filter(site_id=site_id).all()
-
-                weekday = datetime.now().weekday()
-                hour = datetime.now().hour
-                exclude_sub_users = ["348170", "355211", "112293", "163986"]
-                for sub_user in sub_users:
-                    # 对特定用户周六、周日不推送，周一至周五9-18时推送
-                    if (weekday in [5, 6] or (weekday in [0, 1, 2, 3, 4] and (hour < 9 or hour > 18))) and sub_user.staff_number in exclude_sub_users:
-                        continue
-
-                    # 命中推送过滤关键词才进行推送
-                    if is_hit_keywords(page_content.title, page_content.content, sub_user.filter_keywords):
-                        await DingTalkClient.send_message(
-                            user_id=sub_user.staff_number,
-                            title=page_content.title,
-                            summary=summary,
-                            url=page_content.display_url if page_content.display_url != "" else page_content.url,
-                            source=page_content.site_name,
-                        )
-                        server_logger.info(f"Push message to {sub_user.staff_number}: {page_content.title}")
+            list_state = CrawlListStateMsg.model_validate_json(msg.data.decode("utf-8"))
+            await SiteListState.update_or_create(
+                site_id=list_state.site_id,
+                defaults={
+                    "etag": list_state.etag,
+                    "last_modified": list_state.last_modified,
+                    "links_hash": list_state.links_hash,
+                    "rule_hash": list_state.rule_hash,
+                },
+            )
         except Exception as e:
-            server_logger.error(f"Subscribe crawl page content error: {e}")
+            server_logger.error(f"Subscribe crawl list state error: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await HttpClient.init(conn_limit=10, conn_limit_per_host=10, timeout=10)
     
     # 初始化百炼
-    Bailian.init(app_settings.dashscope_api_key, app_settings.dashscope_interpretation_app_id)
+    Bailian.init(
+        app_settings.dashscope_api_key,
+        app_settings.dashscope_interpretation_app_id,
+        summary_input_tokens=app_settings.llm_summary_input_tokens,
+        summary_chunk_tokens=app_settings.llm_summary_chunk_tokens,
+        summary_max_chunks=app_settings.llm_summary_max_chunks,
+        interpretation_input_tokens=app_settings.llm_interpretation_input_tokens,
+    )
+    LlmGateway.init(
+        max_concurrency=app_settings.llm_max_concurrency,
+        tokens_per_minute=app_settings.llm_tokens_per_minute,
+        max_retries=app_settings.llm_max_retries,
+        retry_base_delay=app_settings.llm_retry_base_delay,
+        breaker_threshold=app_settings.llm_breaker_threshold,
+        breaker_reset_timeout=app_settings.llm_breaker_reset_timeout,
+        max_streams=app_settings.llm_max_streams,
+    )
 
     # 初始化OSS
     OSS.init(
@@ -102,6 +81,7 @@ async def lifespan(app: FastAPI):
         accesskey_id=app_settings.push_oss_accesskey_id,
         accesskey_secret=app_settings.push_oss_accesskey_secret
     )
+    OssSync.init(concurrency=app_settings.oss_sync_concurrency)
 
     # 初始化钉钉
     await DingTalkClient.init(
@@ -109,10 +89,16 @@ async def lifespan(app: FastAPI):
         accesskey_secret=app_settings.dingtalk_accesskey_secret,
         robot_code=app_settings.dingtalk_robot_code
     )
+    PushDispatcher.init(
+        rate=app_settings.dingtalk_push_rate,
+        batch_size=app_settings.dingtalk_push_batch_size,
+        max_retries=app_settings.dingtalk_push_max_retries,
+    )
 
-    # 订阅爬取页面内容并保存和推送
     sub_conn = await MsgQueue.connect(settings=app_settings)
-    asyncio.create_task(subscribe_and_save_crawl_page_content_and_push(sub_conn))
+
+    # 订阅列表页缓存状态并保存
+    asyncio.create_task(subscribe_and_save_crawl_list_state(sub_conn))
 
     # 初始化数据库
     async with RegisterTortoise(
@@ -120,10 +106,69 @@ async def lifespan(app: FastAPI):
         config=generate_tortoise_config(settings=app_settings),
         generate_schemas=True
     ):
+        # 加载去重内存索引
+        await SignatureIndex.load()
+        await DomainBlacklistIndex.load()
+        asyncio.create_task(DomainBlacklistIndex.listen(sub_conn))
+        server_logger.info(f"Signature index loaded, size: {SignatureIndex.size()}")
+        await NearDuplicateIndex.load(
+            window_days=app_settings.near_duplicate_window_days,
+            max_distance=app_settings.near_duplicate_max_distance,
+        )
+
+        # 大模型结果缓存, 定期清理过期缓存
+        LlmCache.init(ttl_days=app_settings.llm_cache_ttl_days, max_entries=app_settings.llm_cache_max_entries)
+        asyncio.create_task(LlmCache.run_eviction(app_settings.llm_cache_evict_interval))
+
+        # 加载站点配置缓存, 并订阅配置失效通知
+        await SiteConfigCache.load()
+        asyncio.create_task(SiteConfigCache.listen(sub_conn))
+        if app_settings.site_config_reload_interval > 0:
+            asyncio.create_task(SiteConfigCache.run_reload(app_settings.site_config_reload_interval))
+
+        # 初始化页面批量写入
+        PageWriter.init(
+            batch_size=app_settings.ingest_write_batch_size,
+            flush_interval=app_settings.ingest_write_flush_interval / 1000,
+        )
+
+        # 订阅爬取页面内容并保存和推送
+        IngestPipeline.start(
+            sub_conn,
+            queue_size=app_settings.ingest_queue_size,
+            filter_concurrency=app_settings.ingest_filter_concurrency,
+            summarize_concurrency=app_settings.ingest_summarize_concurrency,
+            persist_concurrency=app_settings.ingest_persist_concurrency,
+            min_fingerprint_length=app_settings.near_duplicate_min_length,
+            skip_duplicate_push=app_settings.near_duplicate_skip_push,
+        )
+
+        # 分发推送发件箱中的消息并定期清理已处理的消息, 可只在部分服务实例上开启
+        if app_settings.push_outbox_dispatch_enabled:
+            asyncio.create_task(OutboxDispatcher.run(
+                interval=app_settings.push_outbox_interval,
+                batch_size=app_settings.push_outbox_batch_size,
+                max_attempts=app_settings.push_outbox_max_attempts,
+                retry_delay=app_settings.push_outbox_retry_delay,
+                digest_batch_size=app_settings.push_outbox_digest_batch_size,
+            ))
+            asyncio.create_task(OutboxDispatcher.run_eviction(
+                retention_days=app_settings.push_outbox_retention_days,
+                interval=app_settings.push_outbox_evict_interval,
+            ))
+
+        # 大模型不可用时保存的页面, 后台重新生成摘要
+        asyncio.create_task(SummaryRetryWorker.run(
+            interval=app_settings.summary_retry_interval,
+            batch_size=app_settings.summary_retry_batch_size,
+        ))
+
         yield
 
-    # 关闭消息队列连接
-    await sub_conn.close()
+        # 关闭消息队列连接, 停止流水线后写入剩余页面
+        await sub_conn.close()
+        await IngestPipeline.shutdown()
+        await PageWriter.shutdown()
 
     await HttpClient.shutdown()
 
@@ -25,17 +25,84 @@ class Settings(BaseSettings):
     nats_port: int = Field(description="NATS port", default=4222)
     nats_auth_token: str = Field(description="NATS auth token", default="")
 
+    # page content ingest pipeline
+    ingest_queue_size: int = Field(description="Max pages buffered between two ingest pipeline stages", default=100)
+    ingest_filter_concurrency: int = Field(description="Concurrent workers for the signature and keyword filter stage", default=4)
+    ingest_summarize_concurrency: int = Field(description="Concurrent workers for the LLM summary stage", default=8)
+    ingest_persist_concurrency: int = Field(description="Concurrent workers for the database persist stage", default=4)
+    ingest_write_batch_size: int = Field(description="Max pages written to the database in one transaction", default=200)
+    ingest_write_flush_interval: int = Field(description="Max milliseconds a page waits before its batch is written", default=200)
+    site_config_reload_interval: int = Field(description="Seconds between site config cache reloads, picks up edits made directly in the database, 0 disables", default=300)
+
+    # near duplicate content
+    near_duplicate_max_distance: int = Field(description="Max SimHash hamming distance (0-3) treated as near-duplicate content", default=3)
+    near_duplicate_window_days: int = Field(description="Only pages from the last N days are loaded into the near-duplicate index", default=30)
+    near_duplicate_min_length: int = Field(description="Pages shorter than this are not fingerprinted", default=200)
+    near_duplicate_skip_push: bool = Field(description="Skip pushes of near-duplicate pages to users who already received the original page", default=False)
+
     # dingtalk
     dingtalk_accesskey_id: str = Field(description="Dingtalk accesskey id", default="")
     dingtalk_accesskey_secret: str = Field(description="Dingtalk accesskey secret", default="")
     dingtalk_robot_code: str = Field(description="Dingtalk robot code", default="")
+    dingtalk_push_rate: float = Field(description="Max DingTalk batch send calls per second", default=10)
+    dingtalk_push_batch_size: int = Field(description="Users per DingTalk batch send call (API limit 20)", default=20)
+    dingtalk_push_max_retries: int = Field(description="Retries for failed or flow-controlled DingTalk pushes", default=3)
+
+    # push outbox
+    push_outbox_dispatch_enabled: bool = Field(description="Run the push outbox dispatcher in this server", default=True)
+    push_outbox_interval: int = Field(description="Seconds between push outbox polls when idle", default=10)
+    push_outbox_batch_size: int = Field(description="Push outbox rows claimed per poll", default=50)
+    push_outbox_max_attempts: int = Field(description="Dispatch attempts before a push outbox row is marked failed", default=5)
+    push_outbox_retry_delay: int = Field(description="Base seconds of the push outbox retry backoff", default=30)
+    push_outbox_retention_days: int = Field(description="Days delivered or failed push outbox rows are kept", default=30)
+    push_outbox_evict_interval: int = Field(description="Seconds between push outbox cleanup runs", default=3600)
+    push_outbox_digest_batch_size: int = Field(description="Due digest items claimed per poll, aggregated into one message per user", default=500)
 
     # dashscope
     dashscope_api_key: str = Field(description="Dashscope api key", default="")
     dashscope_interpretation_app_id: str = Field(description="Dashscope interpretation app id", default="")
 
+    # llm gateway
+    llm_max_concurrency: int = Field(description="Max in-flight LLM calls per server", default=8)
+    llm_max_streams: int = Field(description="Max in-flight streaming LLM calls per server, separate from llm_max_concurrency", default=4)
+    llm_tokens_per_minute: int = Field(description="Estimated LLM tokens (input + output) allowed per minute", default=1000000)
+    llm_max_retries: int = Field(description="Retries for throttled, 5xx or failed LLM calls", default=3)
+    llm_retry_base_delay: float = Field(description="Base seconds of the jittered exponential retry backoff", default=1)
+    llm_breaker_threshold: int = Field(description="Consecutive LLM failures that open the circuit breaker", default=5)
+    llm_breaker_reset_timeout: float = Field(description="Seconds the circuit breaker stays open before a probe call", default=60)
+    llm_summary_input_tokens: int = Field(description="Articles up to this many estimated tokens are summarized in one call", default=6000, ge=1)
+    llm_summary_chunk_tokens: int = Field(description="Estimated tokens per chunk when summarizing longer articles", default=4000, ge=1)
+    llm_summary_max_chunks: int = Field(description="Max chunks per article, content beyond them is dropped", default=8, ge=1)
+    llm_interpretation_input_tokens: int = Field(description="Interpretation input is trimmed to this many estimated tokens", default=16000, ge=1)
+    summary_retry_interval: int = Field(description="Seconds between re-summarization runs for pages saved while the LLM was unavailable", default=60)
+    summary_retry_batch_size: int = Field(description="Pages re-summarized per run", default=20)
+
+    # llm result cache
+    llm_cache_ttl_days: int = Field(description="Days an LLM summary/interpretation stays cached, 0 disables the cache", default=30)
+    llm_cache_max_entries: int = Field(description="Max cached LLM results, the earliest expiring are evicted first", default=200000)
+    llm_cache_evict_interval: int = Field(description="Seconds between LLM cache eviction runs", default=3600)
+
+    # crawler
+    crawl_list_concurrency: int = Field(description="Max in-flight list page crawls per worker", default=2)
+    crawl_detail_concurrency: int = Field(description="Max in-flight detail page crawls per worker", default=4)
+    crawl_host_rate: float = Field(description="Initial requests per second allowed to the same host", default=0.5)
+    crawl_host_burst: float = Field(description="Token bucket burst size per host", default=2)
+    crawl_host_max_concurrency: int = Field(description="Max in-flight requests per host once the host proves healthy", default=4)
+    crawl_host_latency_threshold: float = Field(description="Responses slower than this (seconds) stop per-host concurrency growth", default=5)
+    static_fetch_conn_limit: int = Field(description="Max keep-alive connections of the static page fetcher", default=100)
+    static_fetch_conn_limit_per_host: int = Field(description="Max keep-alive connections per host of the static page fetcher", default=10)
+    static_fetch_timeout: int = Field(description="Static page fetch timeout in seconds", default=20)
+    extract_workers: int = Field(description="Detail extraction process pool size, 0 means one per CPU core", default=0)
+    browser_pool_size: int = Field(description="Number of warm browsers kept per worker", default=2)
+    browser_pool_max_pages: int = Field(description="Recycle a browser after crawling this many pages", default=100)
+
     # url deduplicate api
     url_deduplicate_api: str = Field(description="URL deduplicate api", default="")
+    url_signature_bloom_api: str = Field(description="Crawled page signature bloom filter api, empty disables the local bloom filter", default="")
+    url_signature_bloom_refresh_interval: int = Field(description="Signature bloom filter refresh interval in seconds", default=600)
+    url_seen_cache_size: int = Field(description="Number of recently seen urls kept by each worker", default=100000)
+    signature_bloom_error_rate: float = Field(description="False positive rate of the signature bloom filter served to workers", default=1e-5)
+    signature_bloom_ttl: int = Field(description="Seconds before the served signature bloom filter is rebuilt", default=300)
 
     # oss
     push_oss_accesskey_id: str = Field(description="OSS access key id", default="")
@@ -43,6 +110,7 @@ class Settings(BaseSettings):
     push_oss_bucket: str = Field(description="OSS bucket name", default="")
     push_oss_endpoint: str = Field(description="OSS endpoint", default="")
     push_oss_region: str = Field(description="OSS region", default="")
+    oss_sync_concurrency: int = Field(description="Concurrent OSS uploads when syncing articles", default=8)
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -0,0 +1,45 @@
+import math
+import struct
+
+# 序列化头部: 位数组长度(bit)和哈希函数个数
+HEADER_FORMAT = ">QI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+
+# 布隆过滤器, 元素为64位整数签名, 位置由签名本身做双重哈希得到
+class BloomFilter:
+    def __init__(self, size: int, hash_count: int, bits: bytearray | None = None):
+        self.size = size
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    # 根据预计元素数量和误判率创建
+    @classmethod
+    def create(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        capacity = max(capacity, 1)
+        size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hash_count = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hash_count)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        size, hash_count = struct.unpack_from(HEADER_FORMAT, data)
+        return cls(size, hash_count, bytearray(data[HEADER_SIZE:]))
+
+    def to_bytes(self) -> bytes:
+        return struct.pack(HEADER_FORMAT, self.size, self.hash_count) + bytes(self.bits)
+
+    def _positions(self, key: int):
+        key &= MASK_64
+        h1 = key
+        h2 = ((key * 0x9E3779B97F4A7C15) & MASK_64) | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: int):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
@@ -1,6 +1,6 @@
 import aiohttp
 import json
-from typing import Any
+from typing import Any, AsyncIterator
 
 class HttpClient:
     _http_connector: aiohttp.TCPConnector | None = None
@@ -24,6 +24,16 @@ class HttpClient:
             async with session.get(url, headers=headers, allow_redirects=True, timeout=cls._http_timeout) as response:
                 return await response.json(content_type=None)
 
+    @classmethod
+    async def get_bytes(cls, url: str, headers: dict[str, str] = {}) -> bytes:
+        if cls._http_connector is None:
+            raise ConnectionError("Http connector not initialized")
+
+        async with aiohttp.ClientSession(connector=cls._http_connector, connector_owner=False) as session:
+            async with session.get(url, headers=headers, allow_redirects=True, timeout=cls._http_timeout) as response:
+                response.raise_for_status()
+                return await response.read()
+
     @classmethod
     async def post(cls, url: str, data: Any, headers: dict[str, str] = {}) -> Any:
         if cls._http_connector is None:
@@ -32,4 +42,28 @@ class HttpClient:
         headers["Content-Type"] = "application/json"
         async with aiohttp.ClientSession(connector=cls._http_connector, connector_owner=False) as session:
             async with session.post(url, headers=headers, data=json.dumps(data), timeout=cls._http_timeout) as response:
-                return await response.json()
\ No newline at end of file
+                return await response.json()
+
+    # 发送POST请求, 逐条返回SSE事件的data内容, 非200响应抛出ClientResponseError
+    @classmethod
+    async def post_sse(cls, url: str, data: Any, headers: dict[str, str] = {}, read_timeout: int = 60) -> AsyncIterator[str]:
+        if cls._http_connector is None:
+            raise ConnectionError("Http connector not initialized")
+
+        headers = {**headers, "Content-Type": "application/json", "Accept": "text/event-stream"}
+        # 流式响应总时长不确定, 只限制连接时间和两次读取之间的间隔
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=cls._http_timeout.total if cls._http_timeout else None, sock_read=read_timeout)
+        async with aiohttp.ClientSession(connector=cls._http_connector, connector_owner=False) as session:
+            async with session.post(url, headers=headers, data=json.dumps(data), timeout=timeout) as response:
+                response.raise_for_status()
+                lines: list[str] = []
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").rstrip("\r\n")
+                    if line == "":
+                        if lines:
+                            yield "\n".join(lines)
+                            lines = []
+                    elif line.startswith("data:"):
+                        lines.append(line[5:].lstrip(" "))
+                if lines:
+                    yield "\n".join(lines)
@@ -0,0 +1,98 @@
+from collections import deque
+from functools import lru_cache
+from typing import Iterable
+
+# 去重后的关键词超过该数量时使用Aho-Corasick自动机单次扫描, 否则逐个使用字符串查找(C实现, 关键词少时更快)
+AUTOMATON_MIN_KEYWORDS = 256
+KEYWORDS_CACHE_SIZE = 4096
+
+
+# 解析逗号分隔的过滤关键词, 空字符串表示不过滤
+def parse_keywords(filter_keywords: str) -> frozenset[str] | None:
+    if not filter_keywords:
+        return None
+    return frozenset(filter_keywords.split(","))
+
+
+# 多关键词匹配器, 一次扫描找出文本中出现的所有关键词
+# 多段文本按空格拼接后匹配, 自动机在段之间保留状态, 不需要拼接字符串
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str]):
+        keywords = set(keywords)
+        # 空关键词与任何文本都匹配
+        self._match_empty = "" in keywords
+        keywords.discard("")
+        self._keywords = sorted(keywords)
+        self._delta: list[dict[str, int]] = []
+        self._outputs: list[frozenset[str] | None] = []
+        if len(self._keywords) >= AUTOMATON_MIN_KEYWORDS:
+            self._build()
+
+    def _build(self):
+        goto: list[dict[str, int]] = [{}]
+        outputs: list[set[str]] = [set()]
+        for keyword in self._keywords:
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = next_state
+                state = next_state
+            outputs[state].add(keyword)
+
+        # 按广度优先计算失败指针, 并展开为确定的状态转移表
+        fail = [0] * len(goto)
+        delta: list[dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for char, next_state in goto[state].items():
+                fail[next_state] = delta[fail[state]].get(char, 0) if state else 0
+                outputs[next_state] |= outputs[fail[next_state]]
+                queue.append(next_state)
+
+        self._delta = delta
+        self._outputs = [frozenset(output) if output else None for output in outputs]
+
+    def find(self, *texts: str) -> set[str]:
+        hits = {""} if self._match_empty else set()
+        if not self._keywords:
+            return hits
+
+        if not self._delta:
+            text = " ".join(texts)
+            hits.update(keyword for keyword in self._keywords if keyword in text)
+            return hits
+
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for index, text in enumerate(texts):
+            if index:
+                text = " " + text
+            for char in text:
+                state = delta[state].get(char, 0)
+                output = outputs[state]
+                if output:
+                    hits |= output
+        return hits
+
+
+# 按关键词集合匹配, 多个集合共用一次扫描, 返回每个集合是否命中, None表示不过滤
+class KeywordSetMatcher:
+    def __init__(self, keyword_sets: list[frozenset[str] | None]):
+        self._keyword_sets = keyword_sets
+        self._matcher = KeywordMatcher(keyword for keywords in keyword_sets if keywords for keyword in keywords)
+
+    def match(self, *texts: str) -> list[bool]:
+        hits = self._matcher.find(*texts)
+        return [keywords is None or not hits.isdisjoint(keywords) for keywords in self._keyword_sets]
+
+
+@lru_cache(maxsize=KEYWORDS_CACHE_SIZE)
+def compile_keywords(filter_keywords: str) -> KeywordMatcher:
+    return KeywordMatcher(filter_keywords.split(","))
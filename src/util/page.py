@@ -1,15 +1,14 @@
 import hashlib
+from util.keyword import compile_keywords
 
 # 检查文章是否命中关键词
 def is_hit_keywords(title: str, content: str, filter_keywords: str) -> bool:
     if not filter_keywords:
         return True
 
-    keywords = filter_keywords.split(",")
-    text = f"{title} {content}"
-    return any(keyword in text for keyword in keywords)
-
-# 获取页面url签名
-def get_signature(url: str) -> str:
-    return hashlib.md5(url.encode()).hexdigest()
+    return bool(compile_keywords(filter_keywords).find(title, content))
 
+# 获取页面url签名, 取md5的前8字节转换为有符号64位整数
+# 与旧版32位十六进制签名在postgres中('x' || substr(signature, 1, 16))::bit(64)::bigint的结果一致
+def get_signature(url: str) -> int:
+    return int.from_bytes(hashlib.md5(url.encode()).digest()[:8], "big", signed=True)
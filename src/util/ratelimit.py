@@ -0,0 +1,22 @@
+import asyncio
+import time
+
+# 令牌桶限速, 按rate匀速补充令牌, 最多累积capacity个
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # 获取令牌, 令牌不足时先预支再等待, 读写之间没有await, 协程间无需加锁
+    async def acquire(self, amount: float = 1):
+        self._refill()
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
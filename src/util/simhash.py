@@ -0,0 +1,33 @@
+from collections import Counter
+import hashlib
+import re
+
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+# 计算文本的64位SimHash指纹, 以连续字符片段为特征, 兼容没有空格分词的中文
+# 返回有符号64位整数, 便于保存到bigint字段
+def simhash(text: str, shingle_size: int = 4) -> int:
+    text = WHITESPACE_PATTERN.sub("", text)
+    if len(text) <= shingle_size:
+        shingles = Counter([text])
+    else:
+        shingles = Counter(text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1))
+
+    weights = [0] * 64
+    for shingle, count in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            if value >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+
+    fingerprint = sum(1 << bit for bit in range(64) if weights[bit] > 0)
+    return fingerprint - (1 << 64) if fingerprint >> 63 else fingerprint
+
+
+# 两个指纹之间不同的位数
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & MASK_64).bit_count()
@@ -0,0 +1,56 @@
+import fnmatch
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 默认去除的跟踪参数和会话参数, 以*结尾表示前缀匹配
+DEFAULT_STRIP_PARAMS = [
+    "utm_*",
+    "spm",
+    "scm",
+    "gclid",
+    "fbclid",
+    "jsessionid",
+    "phpsessid",
+    "sessionid",
+    "aspsessionid*",
+]
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# 路径中的会话参数, 如 /news/1.html;jsessionid=xxx
+PATH_SESSION_PATTERN = re.compile(r";(jsessionid|phpsessid|sessionid)=[^/?#]*", re.IGNORECASE)
+
+
+# url规范化, 仅用于签名和去重, 抓取仍使用原始url
+# 统一http/https、小写域名、去除默认端口、会话参数、跟踪参数、非路由片段和末尾斜杠, 参数按名称排序
+def canonicalize_url(url: str, strip_params: list[str] | None = None) -> str:
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return url
+
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or port == DEFAULT_PORTS[scheme] else f"{host}:{port}"
+
+    path = PATH_SESSION_PATTERN.sub("", parts.path) or "/"
+    if path != "/":
+        path = path.rstrip("/")
+
+    patterns = [pattern.lower() for pattern in DEFAULT_STRIP_PARAMS + (strip_params or [])]
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not any(fnmatch.fnmatchcase(name.lower(), pattern) for pattern in patterns)
+    ))
+
+    # 以/或!开头的片段是前端路由, 需要保留
+    fragment = parts.fragment if parts.fragment.startswith(("/", "!")) else ""
+
+    return urlunsplit(("https", netloc, path, query, fragment))